@@ -0,0 +1,79 @@
+"""
+受信したペイロードのキー変換にかかるメモリ確保量の比較
+
+mipac の ``upper_to_lower`` で全体を変換した場合と、
+:class:`mipa.utils.LazySnakeCaseDict` で参照したキーだけを変換した場合に
+ノート 1 件あたりで確保されるメモリを tracemalloc で計測します。
+参照するキーは ID や本文、投稿者名などを見て絞り込むだけのボットを想定しています。
+
+    python benchmarks/bench_case_conversion.py
+"""
+
+from __future__ import annotations
+
+import json
+import pathlib
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from mipac.utils.format import upper_to_lower
+
+from mipa.utils import LazySnakeCaseDict
+
+PAYLOADS = pathlib.Path(__file__).parent / "payloads" / "notes.jsonl"
+REPEAT = 50
+
+
+def access(message: Any) -> tuple[Any, ...]:
+    note = message["body"]["body"]
+    return (
+        note["id"],
+        note["text"],
+        note["user"]["username"],
+        note["created_at"],
+        note["renote_id"],
+    )
+
+
+def measure(
+    convert: Callable[[Any], Any], frames: list[dict[str, Any]]
+) -> tuple[float, float]:
+    # 変換関数のキャッシュを温める
+    for frame in frames:
+        access(convert(frame))
+
+    kept = []
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        for frame in frames:
+            message = convert(frame)
+            access(message)
+            kept.append(message)
+    elapsed = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(frames) * REPEAT
+    return allocated / count, elapsed / count
+
+
+def main():
+    with PAYLOADS.open(encoding="utf-8") as f:
+        frames = [json.loads(line) for line in f if line.strip()]
+
+    eager_bytes, eager_time = measure(upper_to_lower, frames)
+    lazy_bytes, lazy_time = measure(LazySnakeCaseDict, frames)
+    print(
+        f"upper_to_lower   : {eager_bytes:10.0f} bytes/note, "
+        f"{eager_time * 1e6:8.2f} us/note"
+    )
+    print(
+        f"LazySnakeCaseDict: {lazy_bytes:10.0f} bytes/note, "
+        f"{lazy_time * 1e6:8.2f} us/note"
+    )
+    print(f"reduction        : {1 - lazy_bytes / eager_bytes:10.1%}")
+
+
+if __name__ == "__main__":
+    main()
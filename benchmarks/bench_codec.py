@@ -0,0 +1,59 @@
+"""
+JSONコーデックのベンチマーク
+
+``payloads/notes.jsonl`` にある、ストリーミングで受信したノートのフレーム
+(個人情報は置き換え済み) を使い、利用可能なコーデックごとに
+デコードとエンコードの速度を比較します。
+
+    python benchmarks/bench_codec.py [payloads.jsonl]
+"""
+
+from __future__ import annotations
+
+import pathlib
+import sys
+import timeit
+
+from mipa.codec import CODECS, JSONCodec
+
+PAYLOADS = pathlib.Path(__file__).parent / "payloads" / "notes.jsonl"
+REPEAT = 200
+
+
+def load_frames(path: pathlib.Path) -> list[str]:
+    with path.open(encoding="utf-8") as f:
+        return [line for line in f.read().splitlines() if line]
+
+
+def bench(codec: JSONCodec, frames: list[str]) -> tuple[float, float]:
+    objects = [codec.loads(frame) for frame in frames]
+    decode = timeit.timeit(
+        lambda: [codec.loads(frame) for frame in frames], number=REPEAT
+    )
+    encode = timeit.timeit(
+        lambda: [codec.dumps(obj) for obj in objects], number=REPEAT
+    )
+    count = len(frames) * REPEAT
+    return decode / count, encode / count
+
+
+def main():
+    path = pathlib.Path(sys.argv[1]) if len(sys.argv) > 1 else PAYLOADS
+    frames = load_frames(path)
+    size = sum(len(frame.encode()) for frame in frames) / len(frames)
+    print(f"{len(frames)} frames, {size:.0f} bytes/frame on average")
+    for name, codec_cls in CODECS.items():
+        try:
+            codec = codec_cls()
+        except ImportError:
+            print(f"{name:8}: not installed")
+            continue
+        decode, encode = bench(codec, frames)
+        print(
+            f"{name:8}: decode {decode * 1e6:8.2f} us/frame, "
+            f"encode {encode * 1e6:8.2f} us/frame"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+progress_command のベンチマーク
+
+テキストコマンドと正規表現コマンドを合わせて 500 個登録し、
+以前の全コマンドを線形に走査する方式と、索引と事前コンパイル済みの
+正規表現を使う現在の方式を比較します。
+
+    python benchmarks/bench_commands.py [コマンド数]
+"""
+
+from __future__ import annotations
+
+import asyncio
+import re
+import sys
+import time
+from typing import Any
+
+from mipa.ext.commands import Bot, Command
+
+MESSAGES = 2_000
+
+
+class Message:
+    def __init__(self, content: str):
+        self.content = content
+
+
+async def callback(ctx: Any, *args: Any):
+    pass
+
+
+async def legacy_progress_command(bot: Bot, message: Message):
+    for cmd in bot.all_commands:
+        ctx = await bot.get_context(message, cmd)
+        if cmd.cmd_type == "regex":
+            if re.search(cmd.key, message.content):
+                hit_list = re.findall(cmd.key, message.content)
+                if isinstance(hit_list, list):
+                    hit_list = tuple(hit_list)
+
+                if isinstance(hit_list[0], tuple):
+                    hit_list = tuple(
+                        i for i in hit_list[0] if len(i.rstrip()) > 0
+                    )
+                ctx.args = hit_list
+                await cmd.func.invoke(ctx)
+        elif message.content.find(cmd.key) != -1:
+            await cmd.func.invoke(ctx)
+
+
+def make_bot(count: int) -> Bot:
+    bot = Bot()
+    for i in range(count):
+        if i % 2:
+            command = Command(callback, regex=rf"cmd{i} (\d+)", text=None)
+        else:
+            command = Command(callback, regex=None, text=f"text{i}")
+        bot.add_command(command, None)
+    return bot
+
+
+async def measure(func: Any, bot: Bot, messages: list[Message]) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        await func(bot, message)
+    return time.perf_counter() - start
+
+
+async def main(count: int):
+    bot = make_bot(count)
+    messages = [
+        Message(f"@bot text{i % count} cmd{(i + 1) % count} 10 おはよう")
+        for i in range(MESSAGES)
+    ]
+    # re モジュールのキャッシュ (512 個) を超えるよう、全パターンを一度使う
+    await measure(legacy_progress_command, bot, messages[:count])
+
+    legacy = await measure(legacy_progress_command, bot, messages)
+    current = await measure(Bot.progress_command, bot, messages)
+    print(f"{count} commands, {MESSAGES} messages")
+    print(f"legacy : {legacy / MESSAGES * 1e6:10.2f} us/message")
+    print(f"current: {current / MESSAGES * 1e6:10.2f} us/message")
+    print(f"speedup: {legacy / current:10.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
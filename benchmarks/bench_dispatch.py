@@ -0,0 +1,71 @@
+"""
+Client.dispatch のマイクロベンチマーク
+
+以前の ``dir(self)`` と ``importlib.import_module`` を毎回行う方式と、
+リスナーを事前に解決しておくディスパッチテーブル方式を比較します。
+
+    python benchmarks/bench_dispatch.py
+"""
+
+from __future__ import annotations
+
+import importlib
+import inspect
+import timeit
+from typing import Any
+
+from mipa import Client
+
+NUMBER = 100_000
+
+
+class BenchClient(Client):
+    async def on_note(self, note: Any):
+        pass
+
+    def schedule_event(self, coro, event_name, *args, **kwargs):
+        # タスクの生成コストを除いて、ハンドラーの解決のみを計測する
+        return None
+
+
+async def on_note(note: Any):
+    pass
+
+
+class Listener:
+    async def on_note(self, note: Any):
+        pass
+
+
+def legacy_dispatch(
+    self: BenchClient, event_name: str, *args: Any, **kwargs: Any
+):
+    ev = f"on_{event_name}"
+    for event in self.extra_events.get(ev, []):
+        if inspect.ismethod(event):
+            coro = event
+            event = event.__name__
+        else:
+            foo = importlib.import_module(event.__module__)
+            coro = getattr(foo, ev)
+        self.schedule_event(coro, event, *args, **kwargs)
+    if ev in dir(self):
+        self.schedule_event(getattr(self, ev), ev, *args, **kwargs)
+
+
+def main():
+    client = BenchClient()
+    client.add_listener(on_note)
+    client.add_listener(Listener().on_note)
+
+    legacy = timeit.timeit(
+        lambda: legacy_dispatch(client, "note", None), number=NUMBER
+    )
+    table = timeit.timeit(lambda: client.dispatch("note", None), number=NUMBER)
+    print(f"legacy dispatch: {legacy / NUMBER * 1e6:8.3f} us/event")
+    print(f"table dispatch : {table / NUMBER * 1e6:8.3f} us/event")
+    print(f"speedup        : {legacy / table:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
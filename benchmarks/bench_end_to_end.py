@@ -0,0 +1,77 @@
+"""
+MockMisskeyServer を使ったエンドツーエンドのベンチマーク
+
+ローカルのモックサーバーに ``Client.start`` でログイン・接続し、
+合成ノートを指定した速度で流して ``on_note`` までの遅延と処理速度を計測します。
+
+    python benchmarks/bench_end_to_end.py --rate 10000 --total 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any
+
+from mipa import Client
+from mipa.testing import MockMisskeyServer
+
+
+class BenchClient(Client):
+    def __init__(self, server: MockMisskeyServer, total: int, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+        self.total = total
+        self.received = 0
+        self.latencies: list[float] = []
+        self.first_at = 0.0
+        self.last_at = 0.0
+        self.done = asyncio.Event()
+
+    async def on_ready(self, ws: Any):
+        await self.router.connect_channel(["global"])
+
+    async def on_note(self, note: Any):
+        now = time.perf_counter()
+        if self.received == 0:
+            self.first_at = now
+        self.last_at = now
+        self.received += 1
+        if (latency := self.server.latency_of(note.id)) is not None:
+            self.latencies.append(latency)
+        if self.received >= self.total:
+            self.done.set()
+
+
+async def main(rate: float, total: int, parser_tasks: int):
+    async with MockMisskeyServer() as server:
+        client = BenchClient(server, total, parser_tasks=parser_tasks)
+        runner = asyncio.create_task(
+            client.start(server.url, server.token, log_level=None)
+        )
+        firehose = server.start_firehose(rate, total=total)
+        try:
+            await asyncio.wait_for(client.done.wait(), total / rate + 30)
+        finally:
+            firehose.cancel()
+            await client.disconnect()
+            await asyncio.gather(runner, return_exceptions=True)
+            await client.core.close_session()
+
+    elapsed = client.last_at - client.first_at
+    latencies = sorted(client.latencies)
+    print(f"notes   : {client.received} (target {rate:.0f}/s)")
+    print(f"through : {client.received / elapsed:10.0f} notes/s")
+    print(f"p50     : {statistics.median(latencies) * 1e3:10.2f} ms")
+    print(f"p99     : {latencies[int(len(latencies) * 0.99)] * 1e3:10.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=10_000)
+    parser.add_argument("--total", type=int, default=100_000)
+    parser.add_argument("--parser-tasks", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(main(args.rate, args.total, args.parser_tasks))
@@ -0,0 +1,154 @@
+"""
+通知の振り分けのベンチマーク
+
+複数の種類が混ざった通知のストリームを ``ConnectionState.parse_notification``
+に流し、以前の通知ごとに対応表を作り直していた方式と比較します。
+
+    python benchmarks/bench_notifications.py
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from typing import Any
+
+from mipac.models.notification import (
+    NotificationAchievement,
+    NotificationFollow,
+    NotificationFollowRequest,
+    NotificationNote,
+    NotificationPollEnd,
+    NotificationReaction,
+)
+from mipac.utils.format import str_lower, upper_to_lower
+
+from mipa import Client
+from mipa.state import NOTIFICATION_TYPES, ConnectionState
+
+NOTIFICATIONS = 100_000
+
+USER = {
+    "id": "9k000001abcd",
+    "name": "ユーザー",
+    "username": "user1",
+    "host": None,
+    "avatarUrl": "https://misskey.example/avatar.webp",
+    "avatarBlurhash": None,
+    "isBot": False,
+    "isCat": True,
+    "emojis": {},
+    "onlineStatus": "unknown",
+    "badgeRoles": [],
+}
+NOTE = {
+    "id": "9kn000001xy",
+    "createdAt": "2023-12-24T10:00:00.000Z",
+    "userId": USER["id"],
+    "user": USER,
+    "text": "@bot hello",
+    "visibility": "public",
+    "renoteCount": 0,
+    "repliesCount": 0,
+    "reactions": {},
+    "fileIds": [],
+    "files": [],
+}
+
+
+def notification(index: int, notification_type: str) -> dict[str, Any]:
+    data: dict[str, Any] = {
+        "id": f"9kz{index:06d}ab",
+        "createdAt": "2023-12-24T10:00:00.000Z",
+        "type": notification_type,
+        "isRead": False,
+        "userId": USER["id"],
+        "user": USER,
+    }
+    if notification_type in ("reaction", "mention", "reply", "renote"):
+        data["note"] = NOTE
+    if notification_type == "reaction":
+        data["reaction"] = ":blobcat:"
+    if notification_type == "achievementEarned":
+        data["achievement"] = "notes1"
+    return data
+
+
+class BenchClient(Client):
+    async def on_user_followed(self, notice: Any):
+        pass
+
+    async def on_mention(self, notice: Any):
+        pass
+
+    async def on_reaction(self, notice: Any):
+        pass
+
+    async def on_achievement_earned(self, notice: Any):
+        pass
+
+    def schedule_event(self, coro, event_name, *args, **kwargs):
+        return None
+
+
+async def legacy_parse_notification(
+    state: ConnectionState, notification_data: dict[str, Any]
+):
+    message = upper_to_lower(notification_data)
+    notification_map = {
+        "follow": ("user_followed", NotificationFollow),
+        "mention": ("mention", NotificationNote),
+        "reply": ("reply", NotificationNote),
+        "renote": ("renote", NotificationNote),
+        "quote": ("quote", NotificationNote),
+        "reaction": ("reaction", NotificationReaction),
+        "poll_vote": ("poll_vote", NotificationNote),
+        "poll_ended": ("poll_end", NotificationPollEnd),
+        "receive_follow_request": (
+            "follow_request",
+            NotificationFollowRequest,
+        ),
+        "follow_request_accepted": (
+            "follow_request_accept",
+            NotificationFollow,
+        ),
+        "achievement_earned": (
+            "achievement_earned",
+            NotificationAchievement,
+        ),
+    }
+    dispatch_path, parse_class = notification_map.get(
+        str_lower(message["type"]), (None, None)
+    )
+    if dispatch_path and parse_class:
+        state._ConnectionState__dispatch(
+            dispatch_path, parse_class(message, client=state.api)
+        )
+
+
+async def replay(func: Any, state: ConnectionState, stream: list) -> float:
+    start = time.perf_counter()
+    for data in stream:
+        await func(state, data)
+    return time.perf_counter() - start
+
+
+async def main():
+    client = BenchClient()
+    await client.create_api_session("https://misskey.example", "", None)
+    state = client._get_state()
+
+    types = itertools.cycle(NOTIFICATION_TYPES)
+    stream = [notification(i, next(types)) for i in range(NOTIFICATIONS)]
+
+    legacy = await replay(legacy_parse_notification, state, stream)
+    current = await replay(ConnectionState.parse_notification, state, stream)
+    print(f"{NOTIFICATIONS} notifications, {len(NOTIFICATION_TYPES)} types")
+    print(f"legacy : {legacy / NOTIFICATIONS * 1e6:8.2f} us/notification")
+    print(f"current: {current / NOTIFICATIONS * 1e6:8.2f} us/notification")
+    print(f"skipped: {state.skipped_events} (no listener)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+ClientPool で多数のアカウントを動かした際のメモリ使用量のベンチマーク
+
+MockMisskeyServer に ``--accounts`` 個のClientを接続し、全てが接続した後の
+アイドル状態での1アカウントあたりのメモリ (tracemalloc と RSS) を計測します。
+
+    python benchmarks/bench_pool.py --accounts 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import gc
+import resource
+import time
+import tracemalloc
+
+from mipa import Client
+from mipa.pool import ClientPool
+from mipa.testing import MockMisskeyServer
+
+
+def rss() -> int:
+    # Linux では KiB 単位の最大RSS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+async def main(accounts: int, login_interval: float, channels: bool):
+    async with MockMisskeyServer() as server:
+        pool = ClientPool(login_interval=login_interval)
+        for index in range(accounts):
+            client = Client()
+            if channels:
+
+                async def on_ready(ws, client=client):
+                    await client.router.connect_channel(["main", "home"])
+
+                client.add_listener(on_ready)
+            pool.add(f"bot{index}", client, server.url, server.token)
+
+        gc.collect()
+        tracemalloc.start()
+        before_traced = tracemalloc.get_traced_memory()[0]
+        before_rss = rss()
+        started_at = time.perf_counter()
+        await pool.start()
+        while pool.to_dict()["connected"] < accounts:
+            await asyncio.sleep(0.05)
+        elapsed = time.perf_counter() - started_at
+        await asyncio.sleep(1)
+        gc.collect()
+        traced = tracemalloc.get_traced_memory()[0] - before_traced
+        grown_rss = rss() - before_rss
+        tracemalloc.stop()
+
+        summary = pool.to_dict()
+        await pool.close()
+
+    print(f"accounts  : {accounts} ({summary['connectors']} connectors)")
+    print(f"connected : {elapsed:10.2f} s")
+    print(f"traced    : {traced / accounts / 1024:10.1f} KiB/account")
+    print(f"max rss   : {grown_rss / accounts / 1024:10.1f} KiB/account")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--accounts", type=int, default=200)
+    parser.add_argument("--login-interval", type=float, default=0.0)
+    parser.add_argument("--channels", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.accounts, args.login_interval, args.channels))
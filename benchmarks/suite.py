@@ -0,0 +1,501 @@
+"""
+イベント処理の各段階を個別に計測するベンチマークスイート
+
+フレームのデコードから ``received_message`` の振り分け、 ``ConnectionState``
+のイベントごとの解析、 ``Client.dispatch`` のファンアウト、
+``Router.capture_message`` 、コマンド数ごとの ``progress_command`` 、
+``tasks.Loop`` のスケジューリング精度までを計測し、結果をJSONで出力します。
+``--compare`` に以前の結果を渡すと、悪化したベンチマークを表示して終了コード 1 を返します。
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --compare results.json --only dispatch,router
+
+リポジトリのルートを ``sys.path`` に追加するため、 ``pip install -e .`` を
+していなくても作業ツリーの ``mipa`` を計測します。
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import pathlib
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from typing import Any, Awaitable, Callable, Iterator
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+PAYLOADS = pathlib.Path(__file__).parent / "payloads" / "notes.jsonl"
+REPEAT = 5
+
+Stage = Callable[["Results"], Awaitable[None]]
+STAGES: dict[str, Stage] = {}
+
+
+def stage(name: str) -> Callable[[Stage], Stage]:
+    def decorator(func: Stage) -> Stage:
+        STAGES[name] = func
+        return func
+
+    return decorator
+
+
+class Results:
+    def __init__(self, quick: bool = False):
+        self.quick = quick
+        self.entries: list[dict[str, Any]] = []
+
+    def scale(self, number: int) -> int:
+        return max(number // 10, 1) if self.quick else number
+
+    def add(
+        self,
+        stage: str,
+        name: str,
+        value: float,
+        unit: str,
+        *,
+        lower_is_better: bool = True,
+        **params: Any,
+    ) -> None:
+        entry = {
+            "id": f"{stage}.{name}",
+            "stage": stage,
+            "name": name,
+            "value": value,
+            "unit": unit,
+            "lower_is_better": lower_is_better,
+            "params": params,
+        }
+        self.entries.append(entry)
+        print(f"{entry['id']:48} {value:12.3f} {unit}", file=sys.stderr)
+
+
+def load_frames() -> list[str]:
+    with PAYLOADS.open(encoding="utf-8") as f:
+        return [line for line in f.read().splitlines() if line]
+
+
+async def per_op(
+    func: Callable[[], Awaitable[Any]], number: int, repeat: int = REPEAT
+) -> float:
+    """
+    ``func`` を ``number`` 回実行することを ``repeat`` 回繰り返し、
+    最も速かった回の 1 回あたりの時間 (マイクロ秒) を返します
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        best = min(best, time.perf_counter() - start)
+    return best / number * 1e6
+
+
+def per_op_sync(
+    func: Callable[[], Any], number: int, repeat: int = REPEAT
+) -> float:
+    """:func:`per_op` の同期関数版"""
+    best = min(timeit.repeat(func, number=number, repeat=repeat))
+    return best / number * 1e6
+
+
+class NullSocket:
+    """送信されたフレームを捨てる ``ClientWebSocketResponse`` の代わり"""
+
+    async def send_str(self, data: str, compress: Any = None) -> None:
+        pass
+
+
+def make_client(listeners: int = 1) -> Any:
+    from mipa import Client
+
+    class BenchClient(Client):
+        def schedule_event(self, coro, event_name, *args, **kwargs):
+            # タスクの生成を除き、振り分けのコストのみを計測する
+            return None
+
+    client = BenchClient()
+    for _ in range(listeners):
+
+        async def on_note(note: Any):
+            pass
+
+        client.add_listener(on_note)
+    return client
+
+
+async def make_state(client: Any) -> Any:
+    from mipa.router import Router
+
+    await client.create_api_session("", "https://misskey.example", None)
+    client._router = Router(NullSocket())
+    client._connection = client._get_state()
+    return client._connection
+
+
+@stage("decode")
+async def bench_decode(results: Results) -> None:
+    from mipa.codec import CODECS
+
+    frames = load_frames()
+    number = results.scale(200)
+    for name, codec_cls in CODECS.items():
+        try:
+            codec = codec_cls()
+        except ImportError:
+            continue
+        loads = codec.loads
+        value = per_op_sync(
+            lambda loads=loads: [loads(frame) for frame in frames], number
+        )
+        results.add(
+            "decode", name, value / len(frames), "us/frame", codec=name
+        )
+
+
+@stage("routing")
+async def bench_routing(results: Results) -> None:
+    from mipa.gateway import MisskeyWebSocket
+
+    client = make_client()
+    state = await make_state(client)
+
+    async def noop(message: Any) -> None:
+        pass
+
+    # パーサーの中身を除いた、型名からパーサーを引くまでのコスト
+    state._parser_cache = {key: noop for key in state._parser_names()}
+    ws = MisskeyWebSocket(NullSocket(), client)
+    ws._get_parser = state.get_parser
+    messages = [
+        {"type": event_type, "body": {}}
+        for event_type in ("channel", "noteUpdated", "emojiAdded", "unknown")
+    ]
+    number = results.scale(50_000)
+    for message in messages:
+        value = await per_op(
+            lambda message=message: ws.received_message(message), number
+        )
+        results.add(
+            "routing", message["type"], value, "us/msg", number=number
+        )
+    client._router.close()
+
+
+@stage("parse")
+async def bench_parse(results: Results) -> None:
+    from mipa.state import NOTIFICATION_TYPES
+    from mipa.utils import LazySnakeCaseDict
+
+    frames = [json.loads(frame) for frame in load_frames()]
+    number = results.scale(2_000)
+
+    for listeners in (0, 1):
+        client = make_client(listeners)
+        state = await make_state(client)
+        cycle = itertools.cycle(frames)
+        value = await per_op(
+            lambda state=state, cycle=cycle: state.parse_channel(next(cycle)),
+            number,
+        )
+        results.add(
+            "parse",
+            f"note.listeners={listeners}",
+            value,
+            "us/event",
+            listeners=listeners,
+        )
+        client._router.close()
+
+    client = make_client()
+    for event_name, _ in NOTIFICATION_TYPES.values():
+        client.add_listener(_noop_listener, f"on_{event_name}")
+    state = await make_state(client)
+    note = frames[0]["body"]["body"]
+    for notification_type in NOTIFICATION_TYPES:
+        data = {
+            "id": "9kz000000ab",
+            "createdAt": "2023-12-24T10:00:00.000Z",
+            "type": notification_type,
+            "isRead": False,
+            "userId": note["userId"],
+            "user": note["user"],
+            "note": note,
+            "reaction": ":blobcat:",
+            "achievement": "notes1",
+        }
+        value = await per_op(
+            lambda data=data: state.parse_notification(data), number
+        )
+        results.add(
+            "parse",
+            f"notification.{notification_type}",
+            value,
+            "us/event",
+        )
+
+    updated = {
+        "type": "noteUpdated",
+        "body": {
+            "id": note["id"],
+            "type": "reacted",
+            "body": {"reaction": ":blobcat:", "userId": note["userId"]},
+        },
+    }
+    client.add_listener(_noop_listener, "on_reacted")
+    value = await per_op(
+        lambda: state.parse_note_updated(updated), number
+    )
+    results.add("parse", "note_updated.reacted", value, "us/event")
+    value = per_op_sync(
+        lambda: LazySnakeCaseDict.wrap(note)["user"]["avatar_url"], number
+    )
+    results.add("parse", "lazy_snake_case.wrap", value, "us/op")
+    client._router.close()
+
+
+async def _noop_listener(*args: Any) -> None:
+    pass
+
+
+@stage("dispatch")
+async def bench_dispatch(results: Results) -> None:
+    number = results.scale(100_000)
+    for listeners in (1, 8, 32):
+        client = make_client(listeners)
+        value = per_op_sync(
+            lambda client=client: client.dispatch("note", None), number
+        )
+        results.add(
+            "dispatch",
+            f"listeners={listeners}",
+            value,
+            "us/event",
+            listeners=listeners,
+        )
+    client = make_client(0)
+    value = per_op_sync(lambda: client.dispatch("unknown", None), number)
+    results.add("dispatch", "no_listener", value, "us/event")
+
+
+@stage("router")
+async def bench_router(results: Results) -> None:
+    from mipa.router import Router
+
+    number = results.scale(100_000)
+    router = Router(NullSocket(), max_capure=100)
+    batch = 100
+
+    def capture(note_ids: Iterator[str]) -> Callable[[], Awaitable[None]]:
+        async def run() -> None:
+            for _ in range(batch):
+                await router.capture_message(next(note_ids))
+            # 実際の受信と同じく、ループに戻って書き込みタスクに送信させる
+            await asyncio.sleep(0)
+
+        return run
+
+    ids = iter([f"9kn{i:08d}" for i in range(number * REPEAT)])
+    value = await per_op(capture(ids), number // batch) / batch
+    results.add(
+        "router", "capture.unique", value, "us/note", max_capture=100
+    )
+
+    # 購読済みのノートが繰り返し届く場合
+    hot = itertools.cycle([f"9kn{i:08d}" for i in range(50)])
+    value = await per_op(capture(hot), number // batch) / batch
+    results.add(
+        "router", "capture.repeated", value, "us/note", max_capture=100
+    )
+    router.close()
+
+
+@stage("commands")
+async def bench_commands(results: Results) -> None:
+    from mipa.ext.commands import Bot, Command
+
+    class Message:
+        def __init__(self, content: str):
+            self.content = content
+
+    async def callback(ctx: Any, *args: Any):
+        pass
+
+    number = results.scale(2_000)
+    for count in (10, 100, 500):
+        bot = Bot()
+        for i in range(count):
+            if i % 2:
+                command = Command(
+                    callback, regex=rf"cmd{i} (\d+)", text=None
+                )
+            else:
+                command = Command(callback, regex=None, text=f"text{i}")
+            bot.add_command(command, None)
+        messages = itertools.cycle(
+            [
+                Message(f"@bot text{i % count} cmd{(i + 1) % count} 10 おはよう")
+                for i in range(count)
+            ]
+        )
+        value = await per_op(
+            lambda bot=bot, messages=messages: bot.progress_command(
+                next(messages)
+            ),
+            number,
+        )
+        results.add(
+            "commands",
+            f"commands={count}",
+            value,
+            "us/message",
+            commands=count,
+        )
+
+
+@stage("tasks")
+async def bench_tasks(results: Results) -> None:
+    from mipa.ext.tasks import Loop
+
+    seconds = 0.01
+    count = results.scale(200)
+    stamps: list[float] = []
+
+    async def tick():
+        stamps.append(time.perf_counter())
+        # 実際のタスクと同じく、処理に時間がかかる場合のずれも含めて計測する
+        await asyncio.sleep(0.001)
+
+    await Loop(tick, seconds=seconds, count=count).start()
+    intervals = [b - a for a, b in zip(stamps, stamps[1:])]
+    errors = sorted(abs(interval - seconds) for interval in intervals)
+    results.add(
+        "tasks",
+        "interval_error.mean",
+        sum(errors) / len(errors) * 1e3,
+        "ms",
+        seconds=seconds,
+        count=count,
+    )
+    results.add(
+        "tasks",
+        "interval_error.p99",
+        errors[int(len(errors) * 0.99)] * 1e3,
+        "ms",
+        seconds=seconds,
+    )
+    results.add(
+        "tasks",
+        "drift",
+        (stamps[-1] - stamps[0] - seconds * len(intervals)) * 1e3,
+        "ms",
+        seconds=seconds,
+        count=count,
+    )
+
+
+def environment() -> dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=pathlib.Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        from mipa import __version__
+    except ImportError:
+        __version__ = None
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "mipa": __version__,
+        "commit": commit,
+        "timestamp": time.time(),
+    }
+
+
+def compare(
+    current: list[dict[str, Any]], baseline_path: str, threshold: float
+) -> bool:
+    """
+    以前の結果と比較し、 ``threshold`` を超えて悪化したベンチマークがあれば
+    ``True`` を返します
+    """
+
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {
+            entry["id"]: entry for entry in json.load(f)["results"]
+        }
+    regressed = False
+    for entry in current:
+        previous = baseline.get(entry["id"])
+        if previous is None or not previous["value"]:
+            continue
+        ratio = entry["value"] / previous["value"]
+        if not entry["lower_is_better"]:
+            ratio = 1 / ratio if ratio else float("inf")
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressed = True
+        print(f"{entry['id']:48} {ratio:8.2f}x{mark}", file=sys.stderr)
+    return regressed
+
+
+async def run_stages(names: list[str], quick: bool) -> Results:
+    results = Results(quick=quick)
+    for name in names:
+        await STAGES[name](results)
+    return results
+
+
+def main(args: argparse.Namespace) -> int:
+    names = list(STAGES) if args.only is None else args.only.split(",")
+    unknown = set(names) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"unknown stages: {', '.join(sorted(unknown))}")
+    # ファイルの読み書きはイベントループの外で行う
+    results = asyncio.run(run_stages(names, args.quick))
+
+    report = {"environment": environment(), "results": results.entries}
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output is None:
+        print(output)
+    else:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    if args.compare is not None:
+        return int(compare(results.entries, args.compare, args.threshold))
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--output", help="結果を書き込むJSONファイル")
+    parser.add_argument("--compare", help="比較する以前の結果")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="悪化とみなす割合 (default: 0.2)",
+    )
+    parser.add_argument(
+        "--only", help=f"実行する段階 ({','.join(STAGES)})"
+    )
+    parser.add_argument(
+        "--quick", action="store_true", help="回数を 1/10 にする"
+    )
+    sys.exit(main(parser.parse_args()))
@@ -30,41 +30,194 @@ DEALINGS IN THE SOFTWARE.
 from __future__ import annotations
 
 import asyncio
-import importlib
-import inspect
 import logging
 import re
 import sys
+import time
 import traceback
-from typing import Any, Callable, Coroutine, Dict, Optional, Tuple, Union
-
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import aiohttp
 from aiohttp import ClientWebSocketResponse
 from mipac.client import Client as API
+from mipac.config import config as mipac_config
+from mipac.http import HTTPClient, MisskeyClientWebSocketResponse, Route
 from mipac.manager.client import ClientManager
 from mipac.models.user import MeDetailed
 
+from mipa.codec import CodecName, JSONCodec, get_codec
 from mipa.exception import WebSocketNotConnected, WebSocketReconnect
-from mipa.gateway import MisskeyWebSocket
+from mipa.executor import EventExecutor, OverflowPolicy
+from mipa.gateway import (
+    HeartbeatStats,
+    MisskeyWebSocket,
+    ReceiveStats,
+    TransferStats,
+)
+from mipa.metrics import MetricsRegistry, MetricsServer, to_prometheus
+from mipa.monitor import LoopMonitor
+from mipa.offload import PoolKind, WorkerPool, current_client
+from mipa.reconnect import ConnectionHealth, ReconnectPolicy
+from mipa.replay import FrameRecorder
 from mipa.router import Router
-from mipa.state import ConnectionState
-from mipa.utils import LOGING_LEVEL_TYPE, setup_logging
+from mipa.shard import ShardKey, ShardManager
+from mipa.state import (
+    NOTIFICATION_TYPES,
+    ConnectionState,
+    NotificationModel,
+)
+from mipa.utils import LOGING_LEVEL_TYPE, MISSING, setup_logging
 
 _log = logging.getLogger()
 
+EventHandler = Callable[..., Coroutine[Any, Any, Any]]
+T = TypeVar("T")
+
+
+class _ConnectorHTTPClient(HTTPClient):
+    """
+    共有のコネクターを使うセッションを作る mipac の ``HTTPClient``
+    """
+
+    def __init__(
+        self,
+        url: str,
+        token: Optional[str] = None,
+        *,
+        connector: aiohttp.BaseConnector,
+    ) -> None:
+        super().__init__(url, token)
+        self.connector: aiohttp.BaseConnector = connector
+
+    async def login(self) -> Optional[Dict[str, Any]]:
+        # mipac (requirements.txt で <0.7.0 に固定) の HTTPClient.login は
+        # セッションの作成を差し替える手段がないため、0.6.0 の login と同じ手順で
+        # コネクターだけを変えて作り直している。mipac を更新する際は
+        # HTTPClient.login と親クラスの _session の扱いが変わっていないか確認すること
+        match = re.search(r"^(https?)://([^/]+)", self._url)
+        if match is None:
+            raise ValueError(f"Invalid instance url: {self._url}")
+        mipac_config.from_dict(
+            host=match.group(2), is_ssl=match.group(1) == "https"
+        )
+        self._session = aiohttp.ClientSession(
+            connector=self.connector,
+            connector_owner=False,
+            ws_response_class=MisskeyClientWebSocketResponse,
+        )
+        if self._token is None:
+            return None
+        data = await self.request(Route("POST", "/api/i"), auth=True)
+        mipac_config.from_dict(account_id=data["id"])
+        return data
+
 
 class Client:
     def __init__(
         self,
         loop: Optional[asyncio.AbstractEventLoop] = None,
         max_capture: int = 100,
+        event_workers: Optional[int] = None,
+        event_queue_size: int = 1000,
+        event_overflow: OverflowPolicy = "block",
+        parser_tasks: int = 0,
+        receive_queue_size: int = 1000,
+        json_codec: CodecName | JSONCodec = "auto",
+        reconnect_policy: Optional[ReconnectPolicy] = None,
+        heartbeat_interval: Optional[float] = 30.0,
+        heartbeat_timeout: float = 10.0,
+        recorder: Optional[FrameRecorder] = None,
+        collect_metrics: bool = True,
+        loop_monitor: Optional[LoopMonitor] = MISSING,
+        thread_workers: Optional[int] = None,
+        process_workers: Optional[int] = None,
+        shards: int = 0,
+        shard_by: ShardKey = "user",
+        shard_factory: Optional[Callable[[], Client]] = None,
+        connector: Optional[aiohttp.BaseConnector] = None,
         **options: Dict[Any, Any],
     ):
+        """
+        Parameters
+        ----------
+        loop : Optional[asyncio.AbstractEventLoop], default None
+            使用するイベントループ
+        max_capture : int, default 100
+            同時に購読するノートの最大数
+        event_workers : Optional[int], default None
+            指定するとイベントごとにタスクを作らず、指定した数のワーカーで
+            ハンドラーを実行します
+        event_queue_size : int, default 1000
+            ワーカーが処理を待つイベントの最大数
+        event_overflow : OverflowPolicy, default "block"
+            キューが溢れた際の挙動。 ``block`` は受信を止め、
+            ``drop_oldest`` と ``drop_newest`` はイベントを捨てます。
+            ``block`` で待たせられるのは受信したフレームから発火したイベントのみで、
+            それ以外は :class:`EventExecutor` の説明の通り保留もしくは捨てられます
+        parser_tasks : int, default 0
+            1 以上を指定すると、WebSocketの受信と解析を分離し
+            指定した数のタスクで解析を行います
+        receive_queue_size : int, default 1000
+            解析を待つフレームの最大数。一杯になると受信を待たせます
+        json_codec : CodecName | JSONCodec, default "auto"
+            WebSocketのフレームのエンコード/デコードに使うJSONのコーデック。
+            APIのリクエストには使われません。
+            ``auto`` の場合は orjson, msgspec, json の順に利用可能な物を使います
+        reconnect_policy : Optional[ReconnectPolicy], default None
+            再接続までの待機時間を決めるポリシー。
+            指定しない場合は :class:`ReconnectPolicy` の既定値を使います
+        heartbeat_interval : Optional[float], default 30.0
+            ping を送る間隔 (秒)。 ``None`` でハートビートを無効にします
+        heartbeat_timeout : float, default 10.0
+            pong を待つ時間 (秒)。届かない場合は再接続します
+        recorder : Optional[FrameRecorder], default None
+            指定すると受信した全てのフレームをファイルに記録します。
+            記録したファイルは :func:`mipa.replay.replay` で再生できます。
+            :meth:`connect` が終了する際に閉じられます
+        collect_metrics : bool, default True
+            イベントとハンドラーごとの呼び出し回数、例外の回数、処理時間を記録します。
+            記録した値は :attr:`metrics` から取得できます
+        loop_monitor : Optional[LoopMonitor]
+            イベントループの遅延や実行中のハンドラーの数を監視します。
+            指定しない場合は既定の閾値の :class:`LoopMonitor` を使い、
+            ``None`` を渡すと監視しません
+        thread_workers : Optional[int], default None
+            :func:`mipa.offload.offload` で使うスレッドプールのワーカー数
+        process_workers : Optional[int], default None
+            :func:`mipa.offload.offload` で使うプロセスプールのワーカー数。
+            どちらも ``None`` の場合は ``concurrent.futures`` の既定値を使います
+        shards : int, default 0
+            1 以上を指定すると、受信したフレームを指定した数のプロセスに振り分けて
+            解析とイベントの発火を行います。 ``setup_hook`` 、 ``on_ready`` と
+            ``on_reconnect`` はワーカーでも実行されるため、そこで行うチャンネルへの
+            接続やCogの読み込みはワーカーにも反映されます。
+            詳しくは :class:`ShardManager` を参照してください
+        shard_by : ShardKey, default "user"
+            フレームを振り分けるキー。 ``user`` か ``note``
+        shard_factory : Optional[Callable[[], Client]], default None
+            ワーカーでClientを作成する関数。指定しない場合は引数なしで
+            このClientのクラスを呼び出します
+        connector : Optional[aiohttp.BaseConnector], default None
+            指定するとAPIとWebSocketの接続にこのコネクターを使います。
+            コネクターは閉じられないため、複数のClientで共有できます
+        """
         super().__init__(**options)
         self.max_capture = max_capture
         self._router: Router
         self.url = None
         self.extra_events: Dict[str, Any] = {}
         self.special_events: Dict[str, Any] = {}
+        self._listeners: Dict[str, Tuple[EventHandler, ...]] = {}
+        self._special_listeners: Dict[str, Tuple[EventHandler, ...]] = {}
         self.token: Optional[str] = None
         self.origin_uri: Optional[str] = None
         self.loop = asyncio.get_event_loop() if loop is None else loop
@@ -73,6 +226,56 @@ class Client:
         self.user: MeDetailed
         self.ws: Optional[MisskeyWebSocket] = None
         self.should_reconnect = True
+        self.parser_tasks: int = parser_tasks
+        self.receive_queue_size: int = receive_queue_size
+        self.receive_stats: ReceiveStats = ReceiveStats()
+        self.codec: JSONCodec = get_codec(json_codec)
+        self.reconnect_policy: ReconnectPolicy = (
+            ReconnectPolicy() if reconnect_policy is None else reconnect_policy
+        )
+        self.health: ConnectionHealth = ConnectionHealth()
+        self.heartbeat_interval: Optional[float] = heartbeat_interval
+        self.heartbeat_timeout: float = heartbeat_timeout
+        self.heartbeat_stats: HeartbeatStats = HeartbeatStats()
+        self.compress: int = 0
+        self.recorder: Optional[FrameRecorder] = recorder
+        self._metrics: Optional[MetricsRegistry] = (
+            MetricsRegistry() if collect_metrics else None
+        )
+        self._metrics_server: Optional[MetricsServer] = None
+        self.loop_monitor: Optional[LoopMonitor] = (
+            LoopMonitor() if loop_monitor is MISSING else loop_monitor
+        )
+        self.pools: Dict[PoolKind, WorkerPool] = {
+            "thread": WorkerPool("thread", thread_workers),
+            "process": WorkerPool("process", process_workers),
+        }
+        self.connector: Optional[aiohttp.BaseConnector] = connector
+        if shards < 0:
+            raise ValueError("shards must be 0 or greater.")
+        self.shard_manager: Optional[ShardManager] = (
+            ShardManager(
+                self,
+                type(self) if shard_factory is None else shard_factory,
+                shards,
+                shard_by=shard_by,
+            )
+            if shards
+            else None
+        )
+        self.notification_types: Dict[
+            str, Tuple[str, NotificationModel]
+        ] = dict(NOTIFICATION_TYPES)
+        self._executor: Optional[EventExecutor] = None
+        # 実行中のハンドラーの数。 LoopMonitor が読む
+        self._active_handlers: int = 0
+        if event_workers is not None:
+            self._executor = EventExecutor(
+                self._run_event,
+                workers=event_workers,
+                max_queue=event_queue_size,
+                overflow=event_overflow,
+            )
 
     def _get_state(self, **options: Any) -> ConnectionState:
         return ConnectionState(
@@ -102,10 +305,13 @@ class Client:
         if not asyncio.iscoroutinefunction(func):
             raise TypeError("Listeners must be coroutines")
 
-        if name in self.extra_events:
+        if name in self.special_events:
             self.special_events[name].append(func)
         else:
             self.special_events[name] = [func]
+        self._special_listeners[name] = self._resolve_listeners(
+            name, self.special_events
+        )
 
     def listen(self, name: Optional[str] = None):
         def decorator(func: Coroutine[Any, Any, Any]):
@@ -127,6 +333,72 @@ class Client:
             self.extra_events[name].append(func)
         else:
             self.extra_events[name] = [func]
+        self._listeners[name] = self._resolve_listeners(
+            name, self.extra_events
+        )
+
+    def remove_listener(
+        self,
+        func: Union[Coroutine[Any, Any, Any], Callable[..., Any]],
+        name: Optional[str] = None,
+    ):
+        name = func.__name__ if name is None else name
+        if name in self.extra_events:
+            try:
+                self.extra_events[name].remove(func)
+            except ValueError:
+                pass
+        self._listeners[name] = self._resolve_listeners(
+            name, self.extra_events
+        )
+
+    def register_notification(
+        self,
+        notification_type: str,
+        event_name: str,
+        model: NotificationModel,
+    ) -> None:
+        """
+        通知の種類を登録し、受信した際に ``on_<event_name>`` を発火させます
+
+        既に存在する種類を指定した場合は上書きされます
+
+        Parameters
+        ----------
+        notification_type : str
+            Misskeyから届く通知の型名 (例: ``pollEnded``)
+        event_name : str
+            ``on_`` を除いた発火させるイベント名
+        model : NotificationModel
+            ``model(notification, client=ClientManager)`` の形で呼び出され、
+            その戻り値がイベントに渡されます
+        """
+
+        self.notification_types[notification_type] = (event_name, model)
+
+    def _resolve_listeners(
+        self, ev: str, events: Dict[str, Any]
+    ) -> Tuple[EventHandler, ...]:
+        """
+        イベントに対応するコルーチンを解決します
+
+        Parameters
+        ----------
+        ev : str
+            on_ から始まるイベント名
+        events : Dict[str, Any]
+            extra_events もしくは special_events
+
+        Returns
+        -------
+        Tuple[EventHandler, ...]
+            登録されたリスナーと、存在する場合は同名のメソッド
+        """
+
+        handlers = tuple(events.get(ev, ()))
+        if (method := getattr(self, ev, None)) is not None:
+            handlers += (method,)
+        return handlers
 
     def event_dispatch(
         self, event_name: str, *args: Tuple[Any], **kwargs: Dict[Any, Any]
@@ -146,28 +418,47 @@ class Client:
         """
 
         ev = f"on_{event_name}"
-        for event in self.special_events.get(ev, []):
-            foo = importlib.import_module(event.__module__)
-            coro = getattr(foo, ev)
-            self.schedule_event(coro, event, *args, **kwargs)
-        if ev in dir(self):
-            self.schedule_event(getattr(self, ev), ev, *args, **kwargs)
-        return ev in dir(self)
+        try:
+            handlers = self._special_listeners[ev]
+        except KeyError:
+            handlers = self._special_listeners[ev] = self._resolve_listeners(
+                ev, self.special_events
+            )
+        for coro in handlers:
+            self.schedule_event(coro, ev, *args, **kwargs)
+        return hasattr(self, ev)
+
+    def _get_listeners(self, ev: str) -> Tuple[EventHandler, ...]:
+        try:
+            return self._listeners[ev]
+        except KeyError:
+            handlers = self._listeners[ev] = self._resolve_listeners(
+                ev, self.extra_events
+            )
+            return handlers
+
+    def has_listener(self, event_name: str) -> bool:
+        """
+        イベントを受け取るリスナーが存在するかを返します
+
+        Parameters
+        ----------
+        event_name : str
+            ``on_`` を除いたイベント名 (例: ``note``)
+
+        Returns
+        -------
+        bool
+        """
+
+        return bool(self._get_listeners(f"on_{event_name}"))
 
     def dispatch(
         self, event_name: str, *args: tuple[Any], **kwargs: Dict[Any, Any]
     ):
         ev = f"on_{event_name}"
-        for event in self.extra_events.get(ev, []):
-            if inspect.ismethod(event):
-                coro = event
-                event = event.__name__
-            else:
-                foo = importlib.import_module(event.__module__)
-                coro = getattr(foo, ev)
-            self.schedule_event(coro, event, *args, **kwargs)
-        if ev in dir(self):
-            self.schedule_event(getattr(self, ev), ev, *args, **kwargs)
+        for coro in self._get_listeners(ev):
+            self.schedule_event(coro, ev, *args, **kwargs)
 
     def schedule_event(
         self,
@@ -175,7 +466,10 @@ class Client:
         event_name: str,
         *args: tuple[Any],
         **kwargs: Dict[Any, Any],
-    ) -> asyncio.Task[Any]:
+    ) -> Optional[asyncio.Task[Any]]:
+        if self._executor is not None:
+            self._executor.submit(coro, event_name, *args, **kwargs)
+            return None
         return self.loop.create_task(
             self._run_event(coro, event_name, *args, **kwargs),
             name=f"MiPA: {event_name}",
@@ -188,15 +482,39 @@ class Client:
         *args: Any,
         **kwargs: Any,
     ) -> None:
+        started_at = time.perf_counter()
+        error = False
+        token = current_client.set(self)
+        self._active_handlers += 1
         try:
             await coro(*args, **kwargs)
         except asyncio.CancelledError:
-            pass
+            # ハンドラー自身のキャンセルは握りつぶし、実行しているタスクが
+            # キャンセルされた場合 (エグゼキューターの停止など) は伝播させる
+            task = asyncio.current_task()
+            if task is not None and task.cancelling():
+                raise
         except Exception:
+            error = True
             try:
                 await self.__on_error(event_name)
             except asyncio.CancelledError:
                 pass
+        finally:
+            self._active_handlers -= 1
+            current_client.reset(token)
+            if self._metrics is not None:
+                self._metrics.observe(
+                    event_name, coro, time.perf_counter() - started_at, error
+                )
+
+    def _handler_load(self) -> tuple[int, int]:
+        """
+        実行中のハンドラーの数と、エグゼキューターのキューで待っているイベントの数
+        """
+        executor = self._executor
+        queued = 0 if executor is None else executor.queue_depth
+        return self._active_handlers, queued
 
     @staticmethod
     async def __on_error(event_method: str) -> None:
@@ -235,6 +553,10 @@ class Client:
         """
 
         core = await self.create_api_session(token, url, log_level)
+        if self.connector is not None:
+            core.http = _ConnectorHTTPClient(
+                url, token, connector=self.connector
+            )
         await core.http.login()
         self.user = await core.api.get_me()
         await self.setup_hook()
@@ -249,9 +571,24 @@ class Client:
         coro = MisskeyWebSocket.from_client(
             self, timeout=timeout, event_name=event_name
         )
+        self.health.record_attempt()
         self.ws = await asyncio.wait_for(coro, timeout=60)
-        while True:
-            await self.ws.poll_event()
+        self.health.record_connected()
+        executor = self._executor
+        try:
+            while True:
+                if executor is not None:
+                    await executor.wait_for_capacity()
+                await self.ws.poll_event()
+        finally:
+            await self.ws.stop_heartbeat()
+            await self.ws.stop_parsers()
+            self._router.close()
+            if self.recorder is not None:
+                await self.recorder.flush()
+            _log.debug(
+                f"Connection closed: {self.ws.transfer_stats.to_dict()}"
+            )
 
     async def connect(
         self,
@@ -261,14 +598,63 @@ class Client:
     ) -> None:
         self.should_reconnect = reconnect
         event_name = "ready"
-        while True:
-            try:
-                await self._connect(timeout=timeout, event_name=event_name)
-            except (WebSocketReconnect, asyncio.exceptions.TimeoutError):
-                if not self.should_reconnect:
-                    break
-                event_name = "reconnect"
-                await asyncio.sleep(3)
+        if self._executor is not None:
+            self._executor.start(self.loop)
+        if self.loop_monitor is not None:
+            self.loop_monitor.attach(self._handler_load)
+            self.loop_monitor.start(self.loop)
+        if self.shard_manager is not None:
+            await self.shard_manager.start()
+        try:
+            while True:
+                try:
+                    await self._connect(
+                        timeout=timeout, event_name=event_name
+                    )
+                except (
+                    WebSocketReconnect,
+                    asyncio.exceptions.TimeoutError,
+                ) as e:
+                    self._on_connection_lost(e)
+                    if not self.should_reconnect:
+                        break
+                    if self.health.connects:
+                        event_name = "reconnect"
+                    await asyncio.sleep(
+                        self.reconnect_policy.delay(
+                            self.health.consecutive_failures
+                        )
+                    )
+        finally:
+            if self.shard_manager is not None:
+                await self.shard_manager.stop()
+            if self.loop_monitor is not None:
+                self.loop_monitor.detach(self._handler_load)
+                await self.loop_monitor.stop()
+            if self._executor is not None:
+                await self._executor.stop()
+            for pool in self.pools.values():
+                await pool.shutdown()
+            if self.recorder is not None:
+                # gzip の終端を書き込む。再び接続した場合は新しく開いて追記する
+                await self.recorder.close()
+
+    def _on_connection_lost(self, error: BaseException) -> None:
+        policy = self.reconnect_policy
+        health = self.health
+        health.record_failure(
+            error.__cause__ or error,
+            stable=health.uptime >= policy.stable_after,
+        )
+        if not self.should_reconnect:
+            return
+        if policy.is_open(health.consecutive_failures):
+            _log.warning(
+                f"Connection failed {health.consecutive_failures} times in a "
+                f"row, waiting {policy.cooldown} seconds before retrying"
+            )
+        else:
+            _log.info(f"Connection lost, reconnecting: {health.last_error}")
 
     async def disconnect(self):
         if not self.ws:
@@ -284,6 +670,142 @@ class Client:
     def router(self) -> Router:
         return self._router
 
+    @property
+    def latency(self) -> Optional[float]:
+        """
+        直近のハートビートで計測した往復時間 (秒)
+        """
+        return self.heartbeat_stats.last_latency
+
+    @property
+    def transfer_stats(self) -> Optional[TransferStats]:
+        """
+        現在の接続で受信したデータ量。接続していない場合は ``None``
+        """
+        return None if self.ws is None else self.ws.transfer_stats
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        """
+        統計情報のスナップショット
+
+        ``events`` と ``handlers`` にはイベント名ごと、ハンドラーごとの
+        呼び出し回数 (``calls``)、例外の回数 (``errors``)、処理時間の
+        平均と最大、p50/p95/p99 (秒) が含まれます。
+        ``collect_metrics=False`` の場合、これらは空になります
+
+        Returns
+        -------
+        Dict[str, Any]
+        """
+
+        snapshot: Dict[str, Any] = (
+            {"events": {}, "handlers": {}}
+            if self._metrics is None
+            else self._metrics.to_dict()
+        )
+        snapshot.update(self._gauges())
+        return snapshot
+
+    def _gauges(self) -> Dict[str, Any]:
+        connection = getattr(self, "_connection", None)
+        return {
+            "receive": self.receive_stats.to_dict(),
+            "connection": self.health.to_dict(),
+            "heartbeat": self.heartbeat_stats.to_dict(),
+            "transfer": (
+                None if self.ws is None else self.ws.transfer_stats.to_dict()
+            ),
+            "executor": (
+                None if self._executor is None else self._executor.to_dict()
+            ),
+            "monitor": (
+                None
+                if self.loop_monitor is None
+                else self.loop_monitor.to_dict()
+            ),
+            "thread_pool": self.pools["thread"].to_dict(),
+            "process_pool": self.pools["process"].to_dict(),
+            "shards": (
+                None
+                if self.shard_manager is None
+                else self.shard_manager.to_dict()
+            ),
+            "skipped_events": (
+                0 if connection is None else connection.skipped_events
+            ),
+        }
+
+    async def start_metrics_server(
+        self, host: str = "127.0.0.1", port: int = 9100
+    ) -> MetricsServer:
+        """
+        Prometheusのテキスト形式で統計情報を返すサーバーを起動します
+
+        ``http://<host>:<port>/metrics`` でハンドラーごとの回数と処理時間の
+        ヒストグラム、受信キューや接続状況などのゲージを取得できます
+
+        Parameters
+        ----------
+        host : str, default "127.0.0.1"
+        port : int, default 9100
+
+        Returns
+        -------
+        MetricsServer
+        """
+
+        if self._metrics_server is not None:
+            return self._metrics_server
+        server = MetricsServer(
+            lambda: to_prometheus(
+                self._metrics or MetricsRegistry(), self._gauges()
+            ),
+            host=host,
+            port=port,
+        )
+        await server.start()
+        self._metrics_server = server
+        return server
+
+    async def stop_metrics_server(self) -> None:
+        if self._metrics_server is not None:
+            await self._metrics_server.close()
+            self._metrics_server = None
+
+    async def run_in_pool(
+        self,
+        func: Callable[..., T],
+        *args: Any,
+        pool: PoolKind = "thread",
+        **kwargs: Any,
+    ) -> T:
+        """
+        同期関数をClientが管理するプールで実行し、結果を返します
+
+        Parameters
+        ----------
+        func : Callable[..., T]
+            実行する関数。プロセスプールの場合は引数と共に pickle できる必要があります
+        pool : PoolKind, default "thread"
+            ``thread`` もしくは ``process``
+
+        Returns
+        -------
+        T
+        """
+
+        return await self.pools[pool].run(func, *args, **kwargs)
+
+    @property
+    def executor(self) -> Optional[EventExecutor]:
+        """
+        ``event_workers`` を指定した場合に使用されるエグゼキューター
+
+        ``queue_depth`` や ``dropped`` からキューの状態を確認できます
+        """
+        return self._executor
+
     async def start(
         self,
         url: str,
@@ -294,6 +816,7 @@ class Client:
         timeout: int = 60,
         is_ayuskey: bool = False,
         log_level: LOGING_LEVEL_TYPE | None = "INFO",
+        compress: int = 0,
     ):
         """
         Starting Bot
@@ -310,7 +833,14 @@ class Client:
             coming soon...
         timeout: int, default 60
             Time until websocket times out
+        compress: int, default 0
+            permessage-deflate のウィンドウサイズ (9 から 15 の bit 数)。
+            0 の場合は圧縮を要求しません。サーバーが対応していない場合は
+            圧縮されずに接続されます
         """
+        if compress and not 9 <= compress <= 15:
+            raise ValueError("compress must be 0 or between 9 and 15.")
+        self.compress = compress
         if log_level is not None:
             setup_logging(level=log_level)
         self.token = token
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Literal
+
+__all__ = (
+    "JSONCodec",
+    "StdlibCodec",
+    "OrjsonCodec",
+    "MsgspecCodec",
+    "CodecName",
+    "get_codec",
+)
+
+CodecName = Literal["auto", "orjson", "msgspec", "json"]
+
+
+class JSONCodec(ABC):
+    """
+    WebSocketで送受信するフレームに使うJSONのエンコーダー/デコーダー
+
+    APIのリクエストは mipac が行うため、コーデックは使われません
+    """
+
+    name: str
+
+    @abstractmethod
+    def loads(self, data: str | bytes) -> Any:
+        ...
+
+    @abstractmethod
+    def dumps(self, obj: Any) -> str:
+        ...
+
+    def __repr__(self) -> str:
+        return f"<{self.__class__.__name__} name={self.name!r}>"
+
+
+class StdlibCodec(JSONCodec):
+    name = "json"
+
+    def loads(self, data: str | bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj)
+
+
+class OrjsonCodec(JSONCodec):
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._loads = orjson.loads
+        self._dumps = orjson.dumps
+
+    def loads(self, data: str | bytes) -> Any:
+        return self._loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return self._dumps(obj).decode()
+
+
+class MsgspecCodec(JSONCodec):
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+
+    def loads(self, data: str | bytes) -> Any:
+        return self._decoder.decode(data)
+
+    def dumps(self, obj: Any) -> str:
+        return self._encoder.encode(obj).decode()
+
+
+CODECS: dict[str, type[JSONCodec]] = {
+    "orjson": OrjsonCodec,
+    "msgspec": MsgspecCodec,
+    "json": StdlibCodec,
+}
+
+
+def get_codec(codec: CodecName | JSONCodec = "auto") -> JSONCodec:
+    """
+    JSONのコーデックを取得します
+
+    Parameters
+    ----------
+    codec : CodecName | JSONCodec, default "auto"
+        ``auto`` の場合は orjson, msgspec の順にインストールされている物を使い、
+        どちらも無ければ標準ライブラリの json を使用します。
+        :class:`JSONCodec` のインスタンスを渡した場合はそのまま返します
+
+    Returns
+    -------
+    JSONCodec
+
+    Raises
+    ------
+    ValueError
+        存在しないコーデック名が指定された
+    ImportError
+        指定したコーデックのライブラリがインストールされていない
+    """
+
+    if isinstance(codec, JSONCodec):
+        return codec
+    if codec == "auto":
+        for codec_cls in (OrjsonCodec, MsgspecCodec):
+            try:
+                return codec_cls()
+            except ImportError:
+                continue
+        return StdlibCodec()
+    try:
+        codec_cls = CODECS[codec]
+    except KeyError:
+        raise ValueError(
+            f"codec must be one of {('auto', *CODECS)}, not {codec!r}."
+        ) from None
+    return codec_cls()
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Coroutine, Literal, Optional
+
+__all__ = ("EventExecutor", "OverflowPolicy")
+
+_log = logging.getLogger(__name__)
+
+OverflowPolicy = Literal["block", "drop_oldest", "drop_newest"]
+
+OVERFLOW_POLICIES: tuple[OverflowPolicy, ...] = (
+    "block",
+    "drop_oldest",
+    "drop_newest",
+)
+
+EventHandler = Callable[..., Coroutine[Any, Any, Any]]
+EventItem = tuple[EventHandler, str, tuple[Any, ...], dict[str, Any]]
+
+
+class EventExecutor:
+    """
+    決まった数のワーカーでイベントハンドラーを実行するエグゼキューター
+
+    イベントごとにタスクを作る代わりに、有限長のキューへ積み
+    常駐するワーカーが順に取り出して実行します。
+
+    Parameters
+    ----------
+    runner : Callable[..., Coroutine[Any, Any, Any]]
+        ハンドラーを実行するコルーチン関数 (通常は ``Client._run_event``)
+    workers : int
+        ワーカーの数
+    max_queue : int
+        キューに保持できるイベントの最大数
+    overflow : OverflowPolicy
+        キューが溢れた際の挙動
+
+        - ``block``: 受信側を空きができるまで待たせる
+        - ``drop_oldest``: 最も古いイベントを捨てる
+        - ``drop_newest``: 新しく来たイベントを捨てる
+
+        ``block`` で待たせられるのは :meth:`wait_for_capacity` を呼ぶ受信ループだけです。
+        チャンネルのハンドラーや ``tasks.loop`` などから発火したイベントは、
+        キューが一杯の間は保留され、保留も ``max_queue`` 件に達すると
+        新しいイベントを捨てます。そのため保持されるイベントは最大で
+        ``max_queue`` の 2 倍になります
+    """
+
+    def __init__(
+        self,
+        runner: EventHandler,
+        *,
+        workers: int,
+        max_queue: int = 1000,
+        overflow: OverflowPolicy = "block",
+    ):
+        if workers <= 0:
+            raise ValueError("workers must be greater than 0.")
+        if max_queue <= 0:
+            raise ValueError("max_queue must be greater than 0.")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"overflow must be one of {OVERFLOW_POLICIES}, "
+                f"not {overflow!r}."
+            )
+        self._runner: EventHandler = runner
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+        self.overflow: OverflowPolicy = overflow
+        self._queue: asyncio.Queue[EventItem] = asyncio.Queue(max_queue)
+        self._pending: deque[EventItem] = deque()
+        self._tasks: list[asyncio.Task[None]] = []
+        self._stopping: bool = False
+        self.dropped: int = 0
+        self.max_queue_depth: int = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """キューに積まれている、もしくは積まれるのを待っているイベントの数"""
+        return self._queue.qsize() + len(self._pending)
+
+    def to_dict(self) -> dict[str, int]:
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "dropped": self.dropped,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        ワーカーを起動します。既に起動している場合は何もしません
+        """
+
+        if self.is_running:
+            return
+        self._stopping = False
+        loop = asyncio.get_event_loop() if loop is None else loop
+        self._tasks = [
+            loop.create_task(self._worker(), name=f"MiPA-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        ワーカーを停止します。実行中のハンドラーはキャンセルされます
+
+        Parameters
+        ----------
+        timeout : float, default 10.0
+            ワーカーの終了を待つ時間 (秒)。キャンセルを無視するハンドラーが
+            あっても、この時間が経過すれば戻ります
+        """
+
+        tasks, self._tasks = self._tasks, []
+        self._stopping = True
+        for task in tasks:
+            task.cancel()
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            _log.warning(
+                f"{len(pending)} event workers did not stop "
+                f"within {timeout} seconds"
+            )
+
+    def submit(
+        self,
+        coro: EventHandler,
+        event_name: str,
+        *args: Any,
+        **kwargs: Any,
+    ) -> None:
+        """
+        イベントをキューに積みます
+
+        ``block`` の場合、キューが一杯であれば保留し、
+        :meth:`wait_for_capacity` で空きが出るまで受信側を待たせます
+        """
+
+        item: EventItem = (coro, event_name, args, kwargs)
+        try:
+            if self._pending:
+                # 順序を保つため、保留中のイベントがある間は後ろに並べる
+                raise asyncio.QueueFull
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            if self.overflow == "drop_newest":
+                self._drop(item)
+            elif self.overflow == "drop_oldest":
+                self._drop(self._queue.get_nowait())
+                self._queue.task_done()
+                self._queue.put_nowait(item)
+            elif len(self._pending) >= self.max_queue:
+                # 受信ループ以外から発火され続けても保留が際限なく増えないようにする
+                self._drop(item)
+            else:
+                self._pending.append(item)
+        depth = self.queue_depth
+        if depth > self.max_queue_depth:
+            self.max_queue_depth = depth
+
+    async def wait_for_capacity(self) -> None:
+        """
+        保留中のイベントが全てキューに入るまで待機します
+        """
+
+        while self._pending:
+            await self._queue.put(self._pending[0])
+            self._pending.popleft()
+
+    def _drop(self, item: EventItem) -> None:
+        self.dropped += 1
+        _log.debug(
+            f"Event queue is full, dropped {item[1]} "
+            f"(total dropped: {self.dropped})"
+        )
+
+    async def _worker(self) -> None:
+        # ハンドラーがキャンセルを握りつぶしても、停止後はループを抜ける
+        while not self._stopping:
+            coro, event_name, args, kwargs = await self._queue.get()
+            try:
+                await self._runner(coro, event_name, *args, **kwargs)
+            finally:
+                self._queue.task_done()
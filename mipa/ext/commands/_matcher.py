@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:
+    from mipa.ext.commands.core import CMD
+
+__all__ = ("TextMatcher", "CommandMatcher")
+
+
+class TextMatcher:
+    """
+    Aho-Corasick法で複数のキーワードを一度の走査で検索する
+
+    Parameters
+    ----------
+    keywords : Iterable[str]
+        検索するキーワード。 :meth:`search` はこの順番の番号を返します
+    """
+
+    __slots__ = ("_goto", "_fail", "_output")
+
+    def __init__(self, keywords: Iterable[str]):
+        goto: list[dict[str, int]] = [{}]
+        output: list[list[int]] = [[]]
+        for keyword_id, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append([])
+                state = next_state
+            output[state].append(keyword_id)
+
+        fail = [0] * len(goto)
+        queue: deque[int] = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] = (
+                    output[next_state] + output[fail[next_state]]
+                )
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+
+    def search(self, text: str) -> set[int]:
+        """
+        テキストに含まれているキーワードの番号を返します
+
+        Parameters
+        ----------
+        text : str
+
+        Returns
+        -------
+        set[int]
+        """
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found: set[int] = set(output[0])
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class CommandMatcher:
+    """
+    コマンドを登録順に保ったまま、テキストに反応する可能性がある物だけを取り出す
+
+    テキストコマンドは :class:`TextMatcher` で一度に検索し、
+    正規表現コマンドは常に候補として返します
+
+    Parameters
+    ----------
+    commands : list[CMD]
+        ``CommandManager.all_commands``
+    """
+
+    __slots__ = ("_commands", "_text_matcher", "_text_positions", "_regex")
+
+    def __init__(self, commands: list[CMD]):
+        self._commands = commands
+        text_positions: list[int] = []
+        keywords: list[str] = []
+        regex: list[int] = []
+        for position, cmd in enumerate(commands):
+            if cmd.cmd_type == "regex":
+                regex.append(position)
+            elif cmd.key is not None:
+                text_positions.append(position)
+                keywords.append(cmd.key)
+        self._text_matcher = TextMatcher(keywords)
+        self._text_positions = text_positions
+        self._regex = regex
+
+    def candidates(self, content: str) -> list[CMD]:
+        """
+        ``content`` に反応する可能性のあるコマンドを登録順に返します
+
+        テキストコマンドは一致した物のみが含まれます
+
+        Parameters
+        ----------
+        content : str
+
+        Returns
+        -------
+        list[CMD]
+        """
+
+        text_positions = self._text_positions
+        positions = [
+            text_positions[i] for i in self._text_matcher.search(content)
+        ]
+        if self._regex:
+            positions.extend(self._regex)
+        positions.sort()
+        commands = self._commands
+        return [commands[position] for position in positions]
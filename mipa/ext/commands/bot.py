@@ -31,20 +31,12 @@ from __future__ import annotations
 
 import asyncio
 import importlib
-import inspect
-import re
-import sys
-import traceback
 from types import ModuleType
 from typing import (
     TYPE_CHECKING,
     Any,
-    Callable,
-    Coroutine,
     List,
     Optional,
-    Tuple,
-    Union,
 )
 
 from mipac.models.emoji import CustomEmoji
@@ -77,12 +69,32 @@ if TYPE_CHECKING:
 
 __all__ = ["BotBase", "Bot"]
 
+# BotBase が定義する何もしない on_* メソッド。サブクラスで上書きされていなければ
+# リスナーとして扱わず、 has_listener や dispatch で無駄な処理をしない
+_NOOP_LISTENERS = frozenset(
+    (
+        "on_ready",
+        "on_user_follow",
+        "on_user_unfollow",
+        "on_user_followed",
+        "on_reply",
+        "on_renote",
+        "on_quote",
+        "on_reaction",
+        "on_poll_vote",
+        "on_poll_end",
+        "on_follow_request",
+        "on_follow_request_accept",
+        "on_achievement_earned",
+        "on_emoji_deleted",
+        "on_emoji_updated",
+    )
+)
+
 
 class BotBase(CommandManager):
     def __init__(self, **options: dict[Any, Any]):
         super().__init__(**options)
-        self.extra_events: dict[str, Any] = {}
-        self.special_events: dict[str, Any] = {}
         self._check_once: List[Any] = []  # TODO: いつか確認する
         self._checks: List[Any] = []  # TODO: いつか確認する
         self._after_invoke = None
@@ -98,6 +110,13 @@ class BotBase(CommandManager):
     def _on_note(self, message):
         self.dispatch("note", message)
 
+    def _resolve_listeners(self, ev, events):
+        if ev in _NOOP_LISTENERS:
+            method = getattr(self, ev, None)
+            if getattr(method, "__func__", None) is BotBase.__dict__[ev]:
+                return tuple(events.get(ev, ()))
+        return super()._resolve_listeners(ev, events)
+
     async def on_ready(self, ws: ClientWebSocketResponse):
         """
         on_readyのデフォルト処理
@@ -107,104 +126,24 @@ class BotBase(CommandManager):
         ws : ClientWebSocketResponse
         """
 
-    def event(self, name: Optional[str] = None):
-        def decorator(func: Coroutine[Any, Any, Any]):
-            self.add_event(func, name)
-            return func
-
-        return decorator
-
-    def add_event(
-        self, func: Coroutine[Any, Any, Any], name: Optional[str] = None
-    ):
-        name = func.__name__ if name is None else name
-        if not asyncio.iscoroutinefunction(func):
-            raise TypeError("Listeners must be coroutines")
-
-        if name in self.extra_events:
-            self.special_events[name].append(func)
-        else:
-            self.special_events[name] = [func]
-
-    def listen(self, name: Optional[str] = None):
-        def decorator(func: Coroutine[Any, Any, Any]):
-            self.add_listener(func, name)
-            return func
-
-        return decorator
-
-    def add_listener(
-        self,
-        func: Union[Coroutine[Any, Any, Any], Callable[..., Any]],
-        name: Optional[str] = None,
-    ):
-        name = func.__name__ if name is None else name
-        if not asyncio.iscoroutinefunction(func):
-            raise TypeError("Listeners must be coroutines")
-
-        if name in self.extra_events:
-            self.extra_events[name].append(func)
-        else:
-            self.extra_events[name] = [func]
-
-    async def event_dispatch(
-        self, event_name: str, *args: Tuple[Any], **kwargs: dict[Any, Any]
-    ) -> bool:
-        """
-        on_ready等といった
-
-        Parameters
-        ----------
-        event_name :
-        args :
-        kwargs :
-
-        Returns
-        -------
-
-        """
-        ev = f"on_{event_name}"
-        for event in self.special_events.get(ev, []):
-            foo = importlib.import_module(event.__module__)
-            coro = getattr(foo, ev)
-            await self.schedule_event(coro, event, *args, **kwargs)
-        if ev in dir(self):
-            await self.schedule_event(getattr(self, ev), ev, *args, **kwargs)
-        return ev in dir(self)
-
-    def dispatch(
-        self, event_name: str, *args: tuple[Any], **kwargs: dict[Any, Any]
-    ):
-        ev = f"on_{event_name}"
-        for event in self.extra_events.get(ev, []):
-            if inspect.ismethod(event):
-                coro = event
-                event = event.__name__
-            else:
-                foo = importlib.import_module(event.__module__)
-                coro = getattr(foo, ev)
-            self.schedule_event(coro, event, *args, **kwargs)
-        if ev in dir(self):
-            self.schedule_event(getattr(self, ev), ev, *args, **kwargs)
-
     async def add_cog(self, cog: Cog, override: bool = False) -> None:
         cog_name = cog.__cog_name__
         existing = self.__cogs.get(cog_name)
         if existing is not None:
             if not override:
                 raise CogNameDuplicate()
-            await self.remove_cog(cog_name)  # TODO: 作る
+            await self.remove_cog(cog_name)
 
         cog = cog._inject(self)
         self.__cogs[cog_name] = cog
 
-    async def remove_cog(self, name: str):  # TODO: Optional[Cog]を返すように
+    async def remove_cog(self, name: str) -> Cog | None:
         """Cogを削除します"""
-        cog = self.__cogs.get(name)
+        cog = self.__cogs.pop(name, None)
         if cog is None:
             return
 
-        cog._inject(self)
+        cog._eject(self)
 
         return cog
 
@@ -249,43 +188,6 @@ class BotBase(CommandManager):
             raise InvalidCogPath(f"cog: {name} へのパスが無効です") from e
         await self._load_from_module(module, name)
 
-    def schedule_event(
-        self,
-        coro: Callable[..., Coroutine[Any, Any, Any]],
-        event_name: str,
-        *args: tuple[Any],
-        **kwargs: dict[Any, Any],
-    ) -> asyncio.Task[Any]:
-        return asyncio.create_task(
-            self._run_event(coro, event_name, *args, **kwargs),
-            name=f"MiPA: {event_name}",
-        )
-
-    async def _run_event(
-        self,
-        coro: Callable[..., Coroutine[Any, Any, Any]],
-        event_name: str,
-        *args: Any,
-        **kwargs: Any,
-    ) -> None:
-        try:
-            await coro(*args, **kwargs)
-        except asyncio.CancelledError:
-            pass
-        except Exception:
-            try:
-                await self.__on_error(event_name)
-            except asyncio.CancelledError:
-                pass
-
-    @staticmethod
-    async def __on_error(event_method: str) -> None:
-        print(f"Ignoring exception in {event_method}", file=sys.stderr)
-        traceback.print_exc()
-
-    async def on_error(self, err):
-        await self.event_dispatch("error", err)
-
     def get_cog(self, name: str) -> Cog | None:
         return self.__cogs.get(name)
 
@@ -293,13 +195,12 @@ class BotBase(CommandManager):
         return cls(message=message, bot=self, cmd=cmd)
 
     async def progress_command(self, message):
-        for cmd in self.all_commands:
-            ctx = await self.get_context(message, cmd)
-            if cmd.cmd_type == "regex":
-                if re.search(cmd.key, message.content):
-                    hit_list = re.findall(cmd.key, message.content)
-                    if isinstance(hit_list, list):
-                        hit_list = tuple(hit_list)
+        content = message.content or ""
+        for cmd in self.command_matcher.candidates(content):
+            if cmd.pattern is not None:
+                if hit_list := cmd.pattern.findall(content):
+                    ctx = await self.get_context(message, cmd)
+                    hit_list = tuple(hit_list)
 
                     if isinstance(hit_list[0], tuple):
                         hit_list = tuple(
@@ -307,10 +208,9 @@ class BotBase(CommandManager):
                         )
                     ctx.args = hit_list
                     await cmd.func.invoke(ctx)
-            elif message.content.find(cmd.key) != -1:
-                await cmd.func.invoke(ctx)
             else:
-                continue
+                ctx = await self.get_context(message, cmd)
+                await cmd.func.invoke(ctx)
 
     async def on_user_follow(self, user: UserDetailedNotMe):
         """
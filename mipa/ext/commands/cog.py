@@ -151,3 +151,10 @@ class Cog(metaclass=CogMeta):
             bot.add_listener(getattr(self, name), name)
 
         return self
+
+    def _eject(self, bot: BotBase):
+        for command in self.__cog_commands__:
+            bot.remove_command(command)
+
+        for name, method_func in self.__cog_listeners__:
+            bot.remove_listener(getattr(self, name), name)
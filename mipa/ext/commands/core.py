@@ -29,8 +29,10 @@ from __future__ import annotations
 
 import asyncio
 import functools
-from typing import TYPE_CHECKING, List
+import re
+from typing import TYPE_CHECKING, List, Optional
 
+from mipa.ext.commands._matcher import CommandMatcher
 from mipa.ext.commands._types import _BaseCommand
 
 if TYPE_CHECKING:
@@ -54,11 +56,15 @@ class CMD:
         self.key = key
         self.func = func
         self.cog_name = cog_name
+        self.pattern: Optional[re.Pattern[str]] = (
+            re.compile(key) if cmd_type == "regex" else None
+        )
 
 
 class CommandManager:
     def __init__(self, *args, **kwargs):
         self.all_commands: List[CMD] = []
+        self._command_matcher: Optional[CommandMatcher] = None
         super().__init__(*args, **kwargs)  # Clientクラスを初期化する
 
     def add_command(self, command: "Command", cog_name: str):
@@ -69,6 +75,22 @@ class CommandManager:
         self.all_commands.append(
             CMD(command_type, command_key, command, cog_name)
         )
+        self._command_matcher = None
+
+    def remove_command(self, command: "Command"):
+        self.all_commands = [
+            cmd for cmd in self.all_commands if cmd.func is not command
+        ]
+        self._command_matcher = None
+
+    @property
+    def command_matcher(self) -> CommandMatcher:
+        """
+        コマンドの検索に使う索引。コマンドが追加・削除された後に再構築されます
+        """
+        if self._command_matcher is None:
+            self._command_matcher = CommandMatcher(self.all_commands)
+        return self._command_matcher
 
 
 class Command(_BaseCommand):
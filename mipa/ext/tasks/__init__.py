@@ -40,6 +40,7 @@ from typing import (
 )
 
 from mipa.exception import TaskNotRunningError
+from mipa.offload import current_client
 from mipa.utils import MISSING
 
 __all__ = ["Loop", "loop"]
@@ -104,7 +105,19 @@ class Loop(Generic[LF]):
         if not self._task.done():
             self._stop_next_iteration = True
 
+    def _owner_client(self) -> Any:
+        # Clientのメソッド、もしくは bot を持つCogのメソッドであればそのClient
+        from mipa.client import Client
+
+        for owner in (self._injected, getattr(self._injected, "bot", None)):
+            if isinstance(owner, Client):
+                return owner
+        return None
+
     async def _loop(self, *args: tuple[Any], **kwargs: Dict[Any, Any]):
+        # offload した関数が使うClient。ハンドラーから開始した場合は引き継がれる
+        if current_client.get() is None:
+            current_client.set(self._owner_client())
         while True:
             if self._stop_next_iteration is True:
                 return
@@ -30,32 +30,267 @@ DEALINGS IN THE SOFTWARE.
 from __future__ import annotations
 
 import asyncio
-import json
-from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, TypeVar
+import itertools
+import logging
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Callable, Optional, TypeVar
 
 import aiohttp
 from aiohttp import ClientError
-from mipac.utils.format import str_lower
 
 from mipa.exception import ClientConnectorError, WebSocketReconnect
+from mipa.offload import current_client
 from mipa.router import Router
+from mipa.state import frame_received_at
 
 if TYPE_CHECKING:
     from .client import Client
+    from .codec import JSONCodec
+    from .replay import FrameRecorder
+    from .shard import ShardManager
 
-__all__ = ("MisskeyWebSocket",)
+__all__ = (
+    "MisskeyWebSocket",
+    "ReceiveStats",
+    "HeartbeatStats",
+    "TransferStats",
+)
 
+_log = logging.getLogger(__name__)
 
 MS = TypeVar("MS", bound="aiohttp.ClientWebSocketResponse")
 
 
+class ReceiveStats:
+    """
+    受信キューの統計情報
+
+    Attributes
+    ----------
+    queue_depth : int
+        解析を待っているフレームの数
+    max_queue_depth : int
+        これまでの queue_depth の最大値
+    backpressure_waits : int
+        キューが一杯で受信を待たせた回数
+    backpressure_time : float
+        キューが一杯で受信を待たせた時間の合計 (秒)
+    last_lag : float
+        直近のフレームが受信されてから解析されるまでの時間 (秒)
+    max_lag : float
+        これまでの last_lag の最大値 (秒)
+    """
+
+    __slots__ = (
+        "queue_depth",
+        "max_queue_depth",
+        "backpressure_waits",
+        "backpressure_time",
+        "last_lag",
+        "max_lag",
+    )
+
+    def __init__(self) -> None:
+        self.queue_depth: int = 0
+        self.max_queue_depth: int = 0
+        self.backpressure_waits: int = 0
+        self.backpressure_time: float = 0.0
+        self.last_lag: float = 0.0
+        self.max_lag: float = 0.0
+
+    def to_dict(self) -> dict[str, int | float]:
+        return {attr: getattr(self, attr) for attr in self.__slots__}
+
+
+class HeartbeatStats:
+    """
+    ハートビートの統計情報
+
+    直近 ``window`` 回分の往復時間 (RTT) を保持し、そこからパーセンタイルを求めます
+
+    Attributes
+    ----------
+    sent : int
+        送信した ping の数
+    received : int
+        時間内に受け取った pong の数
+    missed : int
+        時間内に pong が届かなかった回数
+    paused : int
+        受信ループが止まっていたため、 pong の期限を延ばした回数
+    last_latency : Optional[float]
+        直近の往復時間 (秒)
+    """
+
+    __slots__ = (
+        "sent",
+        "received",
+        "missed",
+        "paused",
+        "last_latency",
+        "_samples",
+    )
+
+    def __init__(self, window: int = 128) -> None:
+        self.sent: int = 0
+        self.received: int = 0
+        self.missed: int = 0
+        self.paused: int = 0
+        self.last_latency: Optional[float] = None
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def observe(self, latency: float) -> None:
+        self.received += 1
+        self.last_latency = latency
+        self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        直近の往復時間のパーセンタイルを返します
+
+        Parameters
+        ----------
+        q : float
+            0 から 100 までの値
+
+        Returns
+        -------
+        Optional[float]
+            まだ計測されていない場合は ``None``
+        """
+
+        if not self._samples:
+            return None
+        samples = sorted(self._samples)
+        index = min(len(samples) - 1, int(len(samples) * q / 100))
+        return samples[index]
+
+    def to_dict(self) -> dict[str, int | float | None]:
+        return {
+            "sent": self.sent,
+            "received": self.received,
+            "missed": self.missed,
+            "paused": self.paused,
+            "last_latency": self.last_latency,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class TransferStats:
+    """
+    1 回の接続で受信したデータ量
+
+    permessage-deflate が有効な場合、 ``wire_bytes`` は圧縮されたままのサイズ、
+    ``decoded_bytes`` は展開後のサイズになります
+
+    Attributes
+    ----------
+    compress : int
+        サーバーと合意した圧縮のウィンドウサイズ (bit)。 0 の場合は圧縮されていません
+    frames : int
+        受信したメッセージの数
+    wire_bytes : Optional[int]
+        実際に受信したバイト数 (WebSocketのフレームヘッダーを含む)。
+        計測できなかった場合は ``None``
+    decoded_bytes : int
+        展開後のメッセージのバイト数の合計
+    """
+
+    __slots__ = ("compress", "frames", "wire_bytes", "decoded_bytes")
+
+    def __init__(self, compress: int = 0) -> None:
+        self.compress: int = compress
+        self.frames: int = 0
+        self.wire_bytes: Optional[int] = None
+        self.decoded_bytes: int = 0
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """展開後のサイズが受信したサイズの何倍か"""
+        if not self.wire_bytes:
+            return None
+        return self.decoded_bytes / self.wire_bytes
+
+    def to_dict(self) -> dict[str, int | float | None]:
+        return {
+            "compress": self.compress,
+            "frames": self.frames,
+            "wire_bytes": self.wire_bytes,
+            "decoded_bytes": self.decoded_bytes,
+            "ratio": self.ratio,
+        }
+
+
+def _track_transfer(
+    socket: aiohttp.ClientWebSocketResponse, stats: TransferStats
+) -> bool:
+    """
+    aiohttp の受信処理を包み、 ``stats`` に受信したバイト数を記録します
+
+    aiohttp はこれらの値を公開していないため内部の属性に依存します。
+    構造が変わっていた場合は何もせずに ``False`` を返します
+    """
+
+    try:
+        protocol = socket._response.connection.protocol
+        reader = socket._reader
+        data_received = protocol.data_received
+        feed_data = reader.feed_data
+    except AttributeError:
+        return False
+
+    def count_wire(data: bytes) -> None:
+        stats.wire_bytes += len(data)
+        data_received(data)
+
+    def count_decoded(message: Any, size: int = 0) -> None:
+        if message.type is aiohttp.WSMsgType.TEXT:
+            # aiohttp が渡す size は文字数のため、UTF-8 のバイト数を数え直す
+            text = message.data
+            stats.frames += 1
+            stats.decoded_bytes += (
+                len(text) if text.isascii() else len(text.encode())
+            )
+        feed_data(message, size)
+
+    try:
+        protocol.data_received = count_wire
+        reader.feed_data = count_decoded
+    except (AttributeError, TypeError):
+        return False
+    stats.wire_bytes = 0
+    return True
+
+
 class MisskeyWebSocket:
     def __init__(self, socket: MS, client: Client):
         self.socket: MS = socket
         self._dispatch = lambda *args: None
         self._connection = None
         self.client = client
-        self._misskey_parsers: Optional[Dict[str, Callable[..., Any]]] = None
+        self._get_parser: Callable[
+            [str], Optional[Callable[..., Any]]
+        ] = lambda event_type: None
+        self._receive_queue: Optional[asyncio.Queue[tuple[float, str]]] = None
+        self._parser_tasks: list[asyncio.Task[None]] = []
+        self.stats: ReceiveStats = client.receive_stats
+        self.codec: JSONCodec = client.codec
+        self.heartbeat_stats: HeartbeatStats = client.heartbeat_stats
+        self._heartbeat_task: Optional[asyncio.Task[None]] = None
+        self._heartbeat_counter = itertools.count()
+        self._pong_waiter: Optional[tuple[bytes, asyncio.Future[None]]] = None
+        # poll_event が受信を待っている間だけセットされる
+        self._receiving: asyncio.Event = asyncio.Event()
+        self.recorder: Optional[FrameRecorder] = client.recorder
+        self.shard_manager: Optional[ShardManager] = client.shard_manager
+        self.transfer_stats: TransferStats = TransferStats(
+            getattr(socket, "compress", 0)
+        )
+        if not _track_transfer(socket, self.transfer_stats):
+            _log.debug("Could not track the bytes received on the wire")
 
     @classmethod
     async def from_client(
@@ -63,38 +298,266 @@ class MisskeyWebSocket:
     ):
         try:
             socket = await client.core.http.session.ws_connect(
-                f"{client.url}?i={client.token}"
+                f"{client.url}?i={client.token}",
+                # ハートビートを使う場合は pong を自分で受け取る
+                autoping=client.heartbeat_interval is None,
+                compress=client.compress,
             )
-            ws = cls(socket, client)
-            ws._dispatch = client.dispatch
-            ws._connection = client._connection
-            ws._misskey_parsers = client._connection.parsers
-            client._router = Router(socket, max_capure=client.max_capture)
+            ws = cls.from_socket(socket, client)
+            if client.heartbeat_interval is not None:
+                ws.start_heartbeat(
+                    client.heartbeat_interval, client.heartbeat_timeout
+                )
             client.dispatch(event_name, socket)
+            if client.shard_manager is not None:
+                client.shard_manager.dispatch(event_name)
             return ws
-        except (ClientConnectorError, ClientError):
-            while True:
-                await asyncio.sleep(3)
-                return await cls.from_client(
-                    client, timeout=timeout, event_name=event_name
-                )
+        except (ClientConnectorError, ClientError) as e:
+            raise WebSocketReconnect() from e
 
         # await ws.poll_event(timeout=timeout)
 
-    async def received_message(self, msg, /):
+    @classmethod
+    def from_socket(cls, socket: MS, client: Client):
+        """
+        接続済みのソケットから MisskeyWebSocket を作成します
+
+        ルーターと解析用のタスクを準備しますが、ハートビートの開始と
+        イベントの発火は行いません。記録したフレームを再生する際にも使われます
+
+        Parameters
+        ----------
+        socket : MS
+            ``ClientWebSocketResponse`` もしくは同じメソッドを持つオブジェクト
+        client : Client
+        """
+
+        ws = cls(socket, client)
+        ws._dispatch = client.dispatch
+        ws._connection = client._connection
+        ws._get_parser = client._connection.get_parser
+        if (router := getattr(client, "_router", None)) is not None:
+            router.attach(socket)
+        else:
+            client._router = Router(
+                socket, max_capure=client.max_capture, codec=client.codec
+            )
+        if client.parser_tasks > 0:
+            ws.start_parsers(client.parser_tasks, client.receive_queue_size)
+        return ws
+
+    def start_parsers(self, count: int, max_size: int = 1000) -> None:
+        """
+        受信と解析を分離し、解析用のタスクを起動します
+
+        以降 :meth:`poll_event` はフレームをキューに積むだけになり、
+        解析は起動したタスクで行われます。 ``count`` が 2 以上の場合、
+        イベントの順序は保証されません
+
+        Parameters
+        ----------
+        count : int
+            解析を行うタスクの数
+        max_size : int, default 1000
+            受信キューに保持できるフレームの最大数
+        """
+
+        if count <= 0:
+            raise ValueError("count must be greater than 0.")
+        self._receive_queue = asyncio.Queue(max_size)
+        self._parser_tasks = [
+            asyncio.create_task(self._parse_worker(), name=f"MiPA-parser-{i}")
+            for i in range(count)
+        ]
+
+    async def stop_parsers(self) -> None:
+        """
+        解析用のタスクを停止します
+        """
+
+        for task in self._parser_tasks:
+            task.cancel()
+        await asyncio.gather(*self._parser_tasks, return_exceptions=True)
+        self._parser_tasks = []
+        self.stats.queue_depth = 0
+
+    def start_heartbeat(self, interval: float, timeout: float = 10.0) -> None:
+        """
+        ハートビートを開始します
+
+        ``interval`` 秒ごとに ping を送り、 ``timeout`` 秒以内に pong が届かない場合は
+        接続が切れたとみなして WebSocket を閉じます。
+        受信ループがフレームの解析やバックプレッシャーで止まっている間は
+        pong を読めないため期限を数えず、受信を再開してから ``timeout`` 秒待ちます。
+        そのため受信ループが動いていれば、切断は最長でも ``interval + timeout`` 秒で
+        検知されます
+
+        Parameters
+        ----------
+        interval : float
+            ping を送る間隔 (秒)
+        timeout : float, default 10.0
+            pong を待つ時間 (秒)
+        """
+
+        if interval <= 0 or timeout <= 0:
+            raise ValueError("interval and timeout must be greater than 0.")
+        self._heartbeat_task = asyncio.create_task(
+            self._heartbeat(interval, timeout), name="MiPA-heartbeat"
+        )
+
+    async def stop_heartbeat(self) -> None:
+        """
+        ハートビートを停止します
+        """
+
+        if self._heartbeat_task is None:
+            return
+        self._heartbeat_task.cancel()
+        await asyncio.gather(self._heartbeat_task, return_exceptions=True)
+        self._heartbeat_task = None
+
+    async def _heartbeat(self, interval: float, timeout: float) -> None:
+        stats = self.heartbeat_stats
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            payload = str(next(self._heartbeat_counter)).encode()
+            waiter: asyncio.Future[None] = loop.create_future()
+            self._pong_waiter = (payload, waiter)
+            sent_at = time.monotonic()
+            try:
+                await self.socket.ping(payload)
+                stats.sent += 1
+                await self._wait_for_pong(waiter, timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                stats.missed += 1
+                _log.warning(
+                    f"No pong received within {timeout} seconds, "
+                    "reconnecting"
+                )
+                # receive() で待っている poll_event に WS_CLOSING_MESSAGE が届く
+                await self.socket.close(code=aiohttp.WSCloseCode.GOING_AWAY)
+                return
+            finally:
+                self._pong_waiter = None
+            stats.observe(time.monotonic() - sent_at)
+
+    async def _wait_for_pong(
+        self, waiter: asyncio.Future[None], timeout: float
+    ) -> None:
+        # pong は poll_event が読むため、受信ループが解析やバックプレッシャーで
+        # 止まっている間は届いていても読まれない。その間は期限を数えず、
+        # 受信を再開してから改めて timeout 秒待つ
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter), timeout)
+                return
+            except asyncio.TimeoutError:
+                if self._receiving.is_set():
+                    raise
+            self.heartbeat_stats.paused += 1
+            await self._receiving.wait()
+
+    def _on_pong(self, payload: bytes) -> None:
+        if self._pong_waiter is None:
+            return
+        expected, waiter = self._pong_waiter
+        if payload == expected and not waiter.done():
+            waiter.set_result(None)
+
+    async def _parse_worker(self) -> None:
+        queue = self._receive_queue
+        stats = self.stats
+        while True:
+            received_at, data = await queue.get()
+            lag = time.monotonic() - received_at
+            stats.last_lag = lag
+            if lag > stats.max_lag:
+                stats.max_lag = lag
+            stats.queue_depth = queue.qsize()
+            try:
+                await self.received_message(
+                    self.codec.loads(data), received_at
+                )
+            except Exception:
+                _log.exception("Failed to parse the received message")
+            finally:
+                queue.task_done()
+
+    async def _enqueue(self, data: str) -> None:
+        queue = self._receive_queue
+        stats = self.stats
+        item = (time.monotonic(), data)
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            stats.backpressure_waits += 1
+            await queue.put(item)
+            stats.backpressure_time += time.monotonic() - item[0]
+        depth = queue.qsize()
+        stats.queue_depth = depth
+        if depth > stats.max_queue_depth:
+            stats.max_queue_depth = depth
+
+    async def received_message(
+        self, msg, /, received_at: Optional[float] = None
+    ):
+        """
+        受信したフレームを解析し、イベントを発火します
+
+        Parameters
+        ----------
+        msg : dict[str, Any]
+            デコードしたフレーム
+        received_at : Optional[float], default None
+            フレームを受信した時刻 (``time.monotonic()``)。
+            指定した場合、イベントを発火するまでの遅延を記録します
+        """
+
         if isinstance(msg, bytes):
             msg = msg.decode()
 
-        await self._misskey_parsers[str_lower(msg["type"]).upper()](msg)
+        if parser := self._get_parser(msg["type"]):
+            token = frame_received_at.set(received_at)
+            # チャンネルのハンドラーで offload した関数を使えるようにする
+            client_token = current_client.set(self.client)
+            try:
+                await parser(msg)
+            finally:
+                current_client.reset(client_token)
+                frame_received_at.reset(token)
+        else:
+            _log.debug(f"Unknown event type: {msg['type']}")
 
     async def poll_event(self, *, timeout: int = 60):
-        msg = await self.socket.receive(timeout=timeout)
+        self._receiving.set()
+        try:
+            msg = await self.socket.receive(timeout=timeout)
+        finally:
+            self._receiving.clear()
 
         if msg is aiohttp.http.WS_CLOSED_MESSAGE:
             raise WebSocketReconnect()
         elif msg is aiohttp.http.WS_CLOSING_MESSAGE:
             raise WebSocketReconnect()
         elif msg.type is aiohttp.WSMsgType.TEXT:
-            await self.received_message(json.loads(msg.data))
+            if self.recorder is not None:
+                self.recorder.record(msg.data)
+            if self.shard_manager is not None and (
+                not self.shard_manager.handles_locally(msg.data)
+            ):
+                await self.shard_manager.feed(msg.data, time.monotonic())
+            elif self._receive_queue is not None:
+                await self._enqueue(msg.data)
+            else:
+                received_at = time.monotonic()
+                await self.received_message(
+                    self.codec.loads(msg.data), received_at
+                )
+        elif msg.type is aiohttp.WSMsgType.PING:
+            await self.socket.pong(msg.data)
+        elif msg.type is aiohttp.WSMsgType.PONG:
+            self._on_pong(msg.data)
         elif msg.type is aiohttp.WSMsgType.ERROR:
             raise WebSocketReconnect()
@@ -0,0 +1,405 @@
+from __future__ import annotations
+
+import bisect
+import logging
+import weakref
+from typing import Any, Callable, Iterable, Iterator, Mapping, Optional
+
+from aiohttp import web
+
+__all__ = (
+    "LatencyHistogram",
+    "HandlerMetrics",
+    "MetricsRegistry",
+    "MetricsServer",
+    "PrometheusSource",
+    "render_prometheus",
+    "to_prometheus",
+)
+
+_log = logging.getLogger(__name__)
+
+# 100µs から約 52 秒まで、2 倍ずつ増える上限
+DEFAULT_BUCKETS: tuple[float, ...] = tuple(0.0001 * 2**i for i in range(20))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class LatencyHistogram:
+    """
+    固定のバケットで処理時間を数えるヒストグラム
+
+    観測した値そのものは保持しないため、観測回数に関わらずメモリ使用量は一定です。
+    パーセンタイルはバケット内を線形補間した近似値になります
+
+    Parameters
+    ----------
+    buckets : tuple[float, ...], default DEFAULT_BUCKETS
+        昇順に並んだ各バケットの上限 (秒)
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets: tuple[float, ...] = buckets
+        # 最後の要素は上限を超えた値 (+Inf)
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        パーセンタイルの近似値を返します
+
+        Parameters
+        ----------
+        q : float
+            0 から 100 までの値
+
+        Returns
+        -------
+        Optional[float]
+            まだ観測されていない場合は ``None``
+        """
+
+        if not self.count:
+            return None
+        rank = self.count * q / 100
+        seen = 0
+        lower = 0.0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                upper = (
+                    self.buckets[index]
+                    if index < len(self.buckets)
+                    else self.max
+                )
+                upper = min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            if index < len(self.buckets):
+                lower = self.buckets[index]
+        return self.max
+
+    def cumulative(self) -> Iterator[tuple[float, int]]:
+        """Prometheusの形式で、上限ごとの累積の観測回数を返します"""
+        total = 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            total += count
+            yield bound, total
+
+    def to_dict(self) -> dict[str, float | int | None]:
+        return {
+            "count": self.count,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class HandlerMetrics:
+    """
+    イベントもしくはハンドラーごとの統計情報
+
+    Attributes
+    ----------
+    calls : int
+        呼び出された回数
+    errors : int
+        例外が発生した回数
+    latency : LatencyHistogram
+        処理にかかった時間 (秒)
+    """
+
+    __slots__ = ("calls", "errors", "latency")
+
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.errors: int = 0
+        self.latency: LatencyHistogram = LatencyHistogram()
+
+    def observe(self, elapsed: float, error: bool) -> None:
+        self.calls += 1
+        if error:
+            self.errors += 1
+        self.latency.observe(elapsed)
+
+    def to_dict(self) -> dict[str, float | int | None]:
+        latency = self.latency.to_dict()
+        del latency["count"]
+        return {"calls": self.calls, "errors": self.errors, **latency}
+
+
+def handler_name(handler: Callable[..., Any]) -> str:
+    """``module.Class.method`` の形式のハンドラー名を返します"""
+    func = getattr(handler, "__func__", handler)
+    module = getattr(func, "__module__", None)
+    qualname = getattr(func, "__qualname__", repr(func))
+    return qualname if module is None else f"{module}.{qualname}"
+
+
+class MetricsRegistry:
+    """
+    イベント名ごと、ハンドラーごとの統計情報を集計する
+    """
+
+    def __init__(self) -> None:
+        self.events: dict[str, HandlerMetrics] = {}
+        self.handlers: dict[tuple[str, str], HandlerMetrics] = {}
+        # 取り除かれたハンドラーやCogを保持し続けないよう、弱参照で持つ
+        self._names: weakref.WeakKeyDictionary[Any, str] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def observe(
+        self,
+        event_name: str,
+        handler: Callable[..., Any],
+        elapsed: float,
+        error: bool = False,
+    ) -> None:
+        """
+        ハンドラーの実行を 1 回記録します
+
+        Parameters
+        ----------
+        event_name : str
+            ``on_`` から始まるイベント名
+        handler : Callable[..., Any]
+            実行したハンドラー
+        elapsed : float
+            処理にかかった時間 (秒)
+        error : bool, default False
+            例外が発生したか
+        """
+
+        # バウンドメソッドは取得するたびに作られるため、関数自体をキーにする
+        func = getattr(handler, "__func__", handler)
+        try:
+            name = self._names[func]
+        except KeyError:
+            name = handler_name(func)
+            try:
+                self._names[func] = name
+            except TypeError:
+                # 弱参照を作れないオブジェクトはキャッシュしない
+                pass
+        except TypeError:
+            name = handler_name(func)
+        try:
+            event = self.events[event_name]
+        except KeyError:
+            event = self.events[event_name] = HandlerMetrics()
+        key = (event_name, name)
+        try:
+            metrics = self.handlers[key]
+        except KeyError:
+            metrics = self.handlers[key] = HandlerMetrics()
+        event.observe(elapsed, error)
+        metrics.observe(elapsed, error)
+
+    def reset(self) -> None:
+        self.events.clear()
+        self.handlers.clear()
+        self._names.clear()
+
+    def to_dict(self) -> dict[str, Any]:
+        handlers: dict[str, dict[str, Any]] = {}
+        for (event_name, name), metrics in self.handlers.items():
+            handlers.setdefault(event_name, {})[name] = metrics.to_dict()
+        return {
+            "events": {
+                event_name: metrics.to_dict()
+                for event_name, metrics in self.events.items()
+            },
+            "handlers": handlers,
+        }
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+    )
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+PrometheusSource = tuple[
+    Mapping[str, str], MetricsRegistry, Optional[Mapping[str, Any]]
+]
+
+
+def _labels(base: str, **labels: str) -> str:
+    extra = ",".join(
+        f'{key}="{_escape(value)}"' for key, value in labels.items()
+    )
+    return ",".join(part for part in (base, extra) if part)
+
+
+def to_prometheus(
+    registry: MetricsRegistry,
+    gauges: Optional[Mapping[str, Any]] = None,
+    *,
+    labels: Optional[Mapping[str, str]] = None,
+) -> str:
+    """
+    統計情報をPrometheusのテキスト形式に変換します
+
+    Parameters
+    ----------
+    registry : MetricsRegistry
+    gauges : Optional[Mapping[str, Any]], default None
+        ``{"receive": {"queue_depth": 0}}`` のような辞書。
+        数値の項目のみが ``mipa_receive_queue_depth`` のようなゲージとして出力されます
+    labels : Optional[Mapping[str, str]], default None
+        全ての値に付けるラベル
+
+    Returns
+    -------
+    str
+    """
+
+    return render_prometheus([(labels or {}, registry, gauges)])
+
+
+def render_prometheus(sources: Iterable[PrometheusSource]) -> str:
+    """
+    複数のClientの統計情報を1つのPrometheusのテキスト形式にまとめます
+
+    同じ名前の値は1つのグループにまとめられ、 ``labels`` で区別されます
+
+    Parameters
+    ----------
+    sources : Iterable[PrometheusSource]
+        ``(labels, registry, gauges)`` の組
+
+    Returns
+    -------
+    str
+    """
+
+    # 名前ごとに (種類, 説明, 行) をまとめる
+    families: dict[str, tuple[str, str, list[str]]] = {}
+
+    def family(metric: str, kind: str, description: str = "") -> list[str]:
+        try:
+            return families[metric][2]
+        except KeyError:
+            lines: list[str] = []
+            families[metric] = (kind, description, lines)
+            return lines
+
+    counters = (
+        ("mipa_handler_calls_total", "calls", "Handler invocations"),
+        ("mipa_handler_errors_total", "errors", "Handler exceptions"),
+    )
+    histogram = "mipa_handler_duration_seconds"
+    sources = list(sources)
+    for metric, _, description in counters:
+        family(metric, "counter", description)
+    family(histogram, "histogram", "Handler execution time")
+    for extra, registry, gauges in sources:
+        base = _labels("", **extra)
+        for (event_name, name), metrics in registry.handlers.items():
+            labels = _labels(base, event=event_name, handler=name)
+            for metric, attr, description in counters:
+                family(metric, "counter").append(
+                    f"{metric}{{{labels}}} {getattr(metrics, attr)}"
+                )
+            lines = family(histogram, "histogram")
+            latency = metrics.latency
+            for bound, total in latency.cumulative():
+                lines.append(
+                    f'{histogram}_bucket{{{labels},le="{_number(bound)}"}} '
+                    f"{total}"
+                )
+            lines.append(f"{histogram}_sum{{{labels}}} {_number(latency.sum)}")
+            lines.append(f"{histogram}_count{{{labels}}} {latency.count}")
+
+        for section, values in (gauges or {}).items():
+            if isinstance(values, Mapping):
+                items = values.items()
+            else:
+                items = (("", values),)
+            for key, value in items:
+                if isinstance(value, bool):
+                    value = int(value)
+                if not isinstance(value, (int, float)):
+                    continue
+                metric = f"mipa_{section}_{key}" if key else f"mipa_{section}"
+                sample = f"{metric}{{{base}}}" if base else metric
+                family(metric, "gauge").append(f"{sample} {_number(value)}")
+
+    lines: list[str] = []
+    for metric, (kind, description, samples) in families.items():
+        if description:
+            lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    ``/metrics`` でPrometheusのテキスト形式の統計情報を返すサーバー
+
+    Parameters
+    ----------
+    render : Callable[[], str]
+        リクエストごとに呼び出され、レスポンスの本文を返す関数
+    host : str, default "127.0.0.1"
+    port : int, default 9100
+        0 の場合は空いているポートを使います
+    """
+
+    def __init__(
+        self,
+        render: Callable[[], str],
+        *,
+        host: str = "127.0.0.1",
+        port: int = 9100,
+    ):
+        self.render: Callable[[], str] = render
+        self.host: str = host
+        self.port: int = port
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/metrics"
+
+    async def _metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            body=self.render().encode(),
+            headers={"Content-Type": PROMETHEUS_CONTENT_TYPE},
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        _log.info(f"Serving metrics on {self.url}")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import time
+from typing import Any, Callable, Literal, Optional
+
+from mipa.metrics import LatencyHistogram
+
+__all__ = ("LoadProbe", "LoopMonitor", "MonitorKind", "ThresholdCallback")
+
+_log = logging.getLogger(__name__)
+
+MonitorKind = Literal["loop_lag", "tasks", "dispatch_delay"]
+ThresholdCallback = Callable[[MonitorKind, float, float], Any]
+# (実行中のハンドラーの数, キューで実行を待っているイベントの数) を返す関数
+LoadProbe = Callable[[], tuple[int, int]]
+
+
+class LoopMonitor:
+    """
+    イベントループの詰まりを監視する
+
+    ``interval`` 秒ごとに sleep が予定よりどれだけ遅れて戻ってきたか (ループの遅延) と、
+    :meth:`attach` で登録されたClientの実行中のハンドラーの数、
+    エグゼキューターのキューで実行を待っているイベントの数を計測します。
+    Clientが数えている値を読むだけなので、既定で有効にしても負荷はほぼありません。
+    また、フレームを受信してからイベントが発火するまでの時間を記録します。
+    値が閾値を超えた時に警告を出し、 ``callback`` を
+    ``callback(kind, value, threshold)`` の形で呼び出します。
+    閾値を超えている間は繰り返し通知せず、下回った後に再び超えた時に通知します
+
+    Parameters
+    ----------
+    interval : float, default 1.0
+        計測する間隔 (秒)
+    lag_threshold : Optional[float], default 0.1
+        ループの遅延の閾値 (秒)。 ``None`` で通知しません
+    tasks_threshold : Optional[int], default 1000
+        実行中のハンドラーとキューで待っているイベントの合計の閾値。
+        ``None`` で通知しません
+    dispatch_delay_threshold : Optional[float], default 1.0
+        受信から発火までの時間の閾値 (秒)。 ``None`` で通知しません
+    callback : Optional[ThresholdCallback], default None
+        閾値を超えた時に呼び出す関数。コルーチン関数も指定できます
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = 1.0,
+        lag_threshold: Optional[float] = 0.1,
+        tasks_threshold: Optional[int] = 1000,
+        dispatch_delay_threshold: Optional[float] = 1.0,
+        callback: Optional[ThresholdCallback] = None,
+    ):
+        if interval <= 0:
+            raise ValueError("interval must be greater than 0.")
+        self.interval: float = interval
+        self.thresholds: dict[MonitorKind, Optional[float]] = {
+            "loop_lag": lag_threshold,
+            "tasks": tasks_threshold,
+            "dispatch_delay": dispatch_delay_threshold,
+        }
+        self.callback: Optional[ThresholdCallback] = callback
+        self.lag: LatencyHistogram = LatencyHistogram()
+        self.dispatch_delay: LatencyHistogram = LatencyHistogram()
+        self.last_lag: float = 0.0
+        self.last_dispatch_delay: float = 0.0
+        self.tasks: int = 0
+        self.max_tasks: int = 0
+        self.queue_depth: int = 0
+        self.max_queue_depth: int = 0
+        self.warnings: int = 0
+        self._exceeded: set[MonitorKind] = set()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._callbacks: set[asyncio.Future[Any]] = set()
+        self._probes: list[LoadProbe] = []
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        監視を開始します。既に開始している場合は何もしません
+        """
+
+        if self.is_running:
+            return
+        loop = asyncio.get_event_loop() if loop is None else loop
+        self._task = loop.create_task(self._run(loop), name="MiPA-monitor")
+
+    def attach(self, probe: LoadProbe) -> None:
+        """
+        ハンドラーの数を計測する関数を登録します
+
+        Parameters
+        ----------
+        probe : LoadProbe
+            (実行中のハンドラーの数, キューで実行を待っているイベントの数) を返す関数
+        """
+
+        if probe not in self._probes:
+            self._probes.append(probe)
+
+    def detach(self, probe: LoadProbe) -> None:
+        """
+        :meth:`attach` で登録した関数を取り除きます
+        """
+
+        try:
+            self._probes.remove(probe)
+        except ValueError:
+            pass
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, loop: asyncio.AbstractEventLoop) -> None:
+        while True:
+            started_at = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started_at - self.interval, 0.0)
+            self.last_lag = lag
+            self.lag.observe(lag)
+            self._check("loop_lag", lag)
+
+            tasks = queue_depth = 0
+            for probe in self._probes:
+                active, queued = probe()
+                tasks += active
+                queue_depth += queued
+            self.tasks = tasks
+            if tasks > self.max_tasks:
+                self.max_tasks = tasks
+            self.queue_depth = queue_depth
+            if queue_depth > self.max_queue_depth:
+                self.max_queue_depth = queue_depth
+            self._check("tasks", tasks + queue_depth)
+
+    def observe_dispatch(self, received_at: float) -> None:
+        """
+        フレームを受信してからイベントが発火するまでの時間を記録します
+
+        Parameters
+        ----------
+        received_at : float
+            フレームを受信した時刻 (``time.monotonic()``)
+        """
+
+        delay = time.monotonic() - received_at
+        self.last_dispatch_delay = delay
+        self.dispatch_delay.observe(delay)
+        self._check("dispatch_delay", delay)
+
+    def _check(self, kind: MonitorKind, value: float) -> None:
+        threshold = self.thresholds[kind]
+        if threshold is None:
+            return
+        if value <= threshold:
+            self._exceeded.discard(kind)
+            return
+        if kind in self._exceeded:
+            return
+        self._exceeded.add(kind)
+        self.warnings += 1
+        _log.warning(f"{kind} is {value:g}, exceeding {threshold:g}")
+        if self.callback is None:
+            return
+        try:
+            result = self.callback(kind, value, threshold)
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._callbacks.add(task)
+                task.add_done_callback(self._callbacks.discard)
+        except Exception:
+            _log.exception("Exception in the monitor callback")
+
+    def to_dict(self) -> dict[str, Any]:
+        lag = self.lag.to_dict()
+        dispatch_delay = self.dispatch_delay.to_dict()
+        return {
+            "loop_lag": self.last_lag,
+            "loop_lag_max": lag["max"],
+            "loop_lag_p99": lag["p99"],
+            "tasks": self.tasks,
+            "max_tasks": self.max_tasks,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "dispatch_delay": self.last_dispatch_delay,
+            "dispatch_delay_max": dispatch_delay["max"],
+            "dispatch_delay_p99": dispatch_delay["p99"],
+            "warnings": self.warnings,
+        }
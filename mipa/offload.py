@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import importlib
+import inspect
+import logging
+import time
+from collections.abc import Mapping
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from contextvars import ContextVar
+from typing import Any, Callable, Literal, Optional, TypeVar
+
+from mipa.metrics import LatencyHistogram
+from mipa.utils import LazySnakeCaseDict, camel_to_snake
+
+__all__ = ("PoolKind", "WorkerPool", "offload", "raw_data")
+
+_log = logging.getLogger(__name__)
+
+PoolKind = Literal["thread", "process"]
+POOL_KINDS: tuple[PoolKind, ...] = ("thread", "process")
+
+T = TypeVar("T")
+
+# イベントを処理しているClient。 Client._run_event 、フレームの解析
+# (チャンネルのハンドラーを含む) と tasks.Loop が設定し、
+# offload した関数はこのClientのプールで実行される
+current_client: ContextVar[Any] = ContextVar(
+    "mipa_current_client", default=None
+)
+
+
+def _timed_call(
+    func: Callable[..., T],
+    submitted_at: float,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+) -> tuple[float, bool, Any]:
+    # プロセスプールでも比較できるよう、システム全体で共通の time.monotonic() を使う
+    started_at = time.monotonic()
+    try:
+        return started_at, True, func(*args, **kwargs)
+    except Exception as e:
+        return started_at, False, e
+
+
+def _call_by_reference(
+    module: str,
+    qualname: str,
+    submitted_at: float,
+    args: tuple[Any, ...],
+    kwargs: dict[str, Any],
+) -> tuple[float, bool, Any]:
+    # offload で包まれた関数はモジュールの属性が包んだ側になり pickle できないため、
+    # ワーカープロセスで名前から元の関数を引き直す
+    target: Any = importlib.import_module(module)
+    for name in qualname.split("."):
+        target = getattr(target, name)
+    spec = getattr(target, "__mipa_offload__", None)
+    func = target if spec is None else spec.func
+    return _timed_call(func, submitted_at, args, kwargs)
+
+
+class WorkerPool:
+    """
+    同期関数をスレッドもしくはプロセスで実行するプール
+
+    ``Client`` が種類ごとに 1 つずつ保持し、最初に使われた時に作成されます。
+    投入してから実行が始まるまでの待ち時間と実行時間を記録します
+
+    Parameters
+    ----------
+    kind : PoolKind
+        ``thread`` もしくは ``process``
+    max_workers : Optional[int], default None
+        ワーカーの数。 ``None`` の場合は ``concurrent.futures`` の既定値を使います
+    """
+
+    def __init__(self, kind: PoolKind, max_workers: Optional[int] = None):
+        if kind not in POOL_KINDS:
+            raise ValueError(
+                f"kind must be one of {POOL_KINDS}, not {kind!r}."
+            )
+        if max_workers is not None and max_workers <= 0:
+            raise ValueError("max_workers must be greater than 0.")
+        self.kind: PoolKind = kind
+        self.max_workers: Optional[int] = max_workers
+        self.submitted: int = 0
+        self.completed: int = 0
+        self.errors: int = 0
+        self.queue_wait: LatencyHistogram = LatencyHistogram()
+        self.run_time: LatencyHistogram = LatencyHistogram()
+        self._executor: Optional[Executor] = None
+
+    @property
+    def active(self) -> int:
+        """投入されてまだ完了していない呼び出しの数"""
+        return self.submitted - self.completed - self.errors
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(
+                    self.max_workers, thread_name_prefix="MiPA-pool"
+                )
+            else:
+                self._executor = ProcessPoolExecutor(self.max_workers)
+        return self._executor
+
+    async def run(
+        self, func: Callable[..., T], *args: Any, **kwargs: Any
+    ) -> T:
+        """
+        ``func(*args, **kwargs)`` をプールで実行し、結果を返します
+
+        プロセスプールの場合、 ``func`` と引数は pickle できる必要があります
+
+        Parameters
+        ----------
+        func : Callable[..., T]
+            同期関数
+
+        Returns
+        -------
+        T
+        """
+
+        submitted_at = time.monotonic()
+        spec: Optional[OffloadSpec] = getattr(func, "__mipa_offload__", None)
+        if spec is not None:
+            func = spec.func
+        if self.kind == "process" and spec is not None:
+            call: Callable[[], Any] = functools.partial(
+                _call_by_reference,
+                func.__module__,
+                func.__qualname__,
+                submitted_at,
+                args,
+                kwargs,
+            )
+        else:
+            call = functools.partial(
+                _timed_call, func, submitted_at, args, kwargs
+            )
+        loop = asyncio.get_running_loop()
+        self.submitted += 1
+        try:
+            started_at, ok, result = await loop.run_in_executor(
+                self._get_executor(), call
+            )
+        except BaseException:
+            # 引数を pickle できなかった場合など、実行が始まらなかった
+            self.errors += 1
+            raise
+        finished_at = time.monotonic()
+        self.queue_wait.observe(max(started_at - submitted_at, 0.0))
+        self.run_time.observe(max(finished_at - started_at, 0.0))
+        if not ok:
+            self.errors += 1
+            raise result
+        self.completed += 1
+        return result
+
+    async def shutdown(self, *, wait: bool = True) -> None:
+        """
+        プールを停止します
+
+        ``wait`` が ``True`` の場合は実行中と待機中の呼び出しが終わるまで待ちます。
+        イベントループを止めないよう、待機は別のスレッドで行われます
+        """
+
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if wait:
+            await asyncio.to_thread(executor.shutdown, wait=True)
+        else:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def to_dict(self) -> dict[str, Any]:
+        queue_wait = self.queue_wait.to_dict()
+        run_time = self.run_time.to_dict()
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "errors": self.errors,
+            "active": self.active,
+            "queue_wait_p50": queue_wait["p50"],
+            "queue_wait_p99": queue_wait["p99"],
+            "queue_wait_max": queue_wait["max"],
+            "run_time_p50": run_time["p50"],
+            "run_time_p99": run_time["p99"],
+        }
+
+
+class OffloadSpec:
+    __slots__ = ("func", "pool", "project")
+
+    def __init__(
+        self,
+        func: Callable[..., Any],
+        pool: PoolKind,
+        project: Optional[Callable[..., tuple[Any, ...]]],
+    ):
+        self.func: Callable[..., Any] = func
+        self.pool: PoolKind = pool
+        self.project: Optional[Callable[..., tuple[Any, ...]]] = project
+
+
+def offload(
+    pool: PoolKind = "thread",
+    *,
+    project: Optional[Callable[..., tuple[Any, ...]]] = None,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    同期関数を、Clientが管理するプールで実行するコルーチン関数に変換します
+
+    ``Client.listen`` や ``Cog.listener`` 、 ``mention_command`` 、
+    チャンネルのハンドラーや ``tasks.loop`` の内側に付けて使い、
+    ハンドラーを実行しているClientのプールで実行されます。
+    関数自体はClientに紐付かないため、同じ関数やCogを複数のClientで使えます。
+    ``project`` を指定すると、ハンドラーに渡された引数の代わりに
+    ``project(*args, **kwargs)`` が返したタプルを引数として関数を呼び出します。
+    プロセスプールでは pickle できる値 (例えば :func:`raw_data` で取り出した
+    ノートの dict) だけを渡すために使います。
+    プロセスプールで実行する関数はモジュールもしくはクラスの直下に定義してください
+
+    .. code-block:: python
+
+        @bot.listen()
+        @offload("process", project=lambda note: (raw_data(note),))
+        def on_note(note: dict):
+            ...
+
+    Parameters
+    ----------
+    pool : PoolKind, default "thread"
+        ``thread`` もしくは ``process``
+    project : Optional[Callable[..., tuple[Any, ...]]], default None
+        ハンドラーの引数を、関数に渡す引数に変換する関数
+    """
+
+    if pool not in POOL_KINDS:
+        raise ValueError(f"pool must be one of {POOL_KINDS}, not {pool!r}.")
+
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        if inspect.iscoroutinefunction(func):
+            raise TypeError("offload can only be used on sync functions.")
+        spec = OffloadSpec(func, pool, project)
+
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            client = current_client.get()
+            if client is None:
+                raise RuntimeError(
+                    f"{func.__qualname__} must be called from "
+                    "an event handler of a Client."
+                )
+            if project is not None:
+                args, kwargs = project(*args, **kwargs), {}
+            return await client.pools[pool].run(wrapper, *args, **kwargs)
+
+        wrapper.__mipa_offload__ = spec  # type: ignore[attr-defined]
+        return wrapper
+
+    return decorator
+
+
+def _snake_case_copy(value: Any) -> Any:
+    if isinstance(value, LazySnakeCaseDict):
+        value = value.raw
+    if isinstance(value, Mapping):
+        return {
+            camel_to_snake(key): _snake_case_copy(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_snake_case_copy(item) for item in value]
+    return value
+
+
+def raw_data(model: Any) -> dict[str, Any]:
+    """
+    mipac のモデルが保持しているデータを、 snake_case のキーの dict で返します
+
+    プロセスプールへ渡せるよう、モデル自身の代わりに使います。
+    モデルがWebSocketから作られたかAPIから作られたかに関わらず、
+    ネストした dict も含め全てのキーを ``upper_to_lower`` と同じ規則で
+    snake_case に変換した複製を返すため、変更してもモデルには影響しません
+
+    Parameters
+    ----------
+    model : Any
+        ``Note`` などのモデル
+
+    Returns
+    -------
+    dict[str, Any]
+    """
+
+    for value in vars(model).values():
+        if isinstance(value, Mapping):
+            return _snake_case_copy(value)
+    raise TypeError(f"{type(model).__name__} does not hold a dict.")
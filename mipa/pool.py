@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from mipa.metrics import MetricsRegistry, MetricsServer, render_prometheus
+from mipa.monitor import LoopMonitor
+from mipa.utils import MISSING
+
+if TYPE_CHECKING:
+    from mipa.client import Client
+
+__all__ = ("ClientPool",)
+
+_log = logging.getLogger(__name__)
+
+
+class _Account:
+    __slots__ = ("name", "client", "url", "token", "options", "task", "error")
+
+    def __init__(
+        self,
+        name: str,
+        client: Client,
+        url: str,
+        token: str,
+        options: dict[str, Any],
+    ):
+        self.name: str = name
+        self.client: Client = client
+        self.url: str = url
+        self.token: str = token
+        self.options: dict[str, Any] = options
+        self.task: Optional[asyncio.Task[None]] = None
+        self.error: Optional[BaseException] = None
+
+    @property
+    def state(self) -> str:
+        if self.task is None:
+            return "pending"
+        if not self.task.done():
+            connected = self.client.health.is_connected
+            return "connected" if connected else "starting"
+        return "failed" if self.error is not None else "stopped"
+
+
+def _host(url: str) -> str:
+    return urlsplit(url if "://" in url else f"//{url}").netloc
+
+
+class ClientPool:
+    """
+    複数のClient (アカウント) を1つのイベントループで動かす
+
+    同じインスタンスのアカウントは1つの ``aiohttp`` のコネクターを共有し、
+    ログインは ``login_interval`` 秒ずつずらして開始されます。
+    イベントループの監視はClientごとではなくプール全体で1つだけ行います。
+
+    .. code-block:: python
+
+        async with ClientPool() as pool:
+            for token in tokens:
+                pool.add(token[:8], MyBot(), "https://example.com", token)
+            await pool.run()
+
+    mipac の設定 (``config``) はプロセス内で共有されるため、
+    インスタンスのホスト名は最後にログインしたアカウントの物になります
+
+    Parameters
+    ----------
+    login_interval : float, default 1.0
+        ログインを開始する間隔 (秒)
+    connector_limit : Optional[int], default None
+        インスタンスごとの同時接続数の上限。 ``None`` の場合は制限しません。
+        WebSocketも接続している間は1つとして数えられるため、
+        アカウントの数より大きな値を指定してください
+    loop_monitor : Optional[LoopMonitor]
+        プール全体で使うイベントループの監視。
+        指定しない場合は既定の閾値の :class:`LoopMonitor` を使い、
+        ``None`` を渡すと監視しません
+    """
+
+    def __init__(
+        self,
+        *,
+        login_interval: float = 1.0,
+        connector_limit: Optional[int] = None,
+        loop_monitor: Optional[LoopMonitor] = MISSING,
+    ):
+        if login_interval < 0:
+            raise ValueError("login_interval must be 0 or greater.")
+        self.login_interval: float = login_interval
+        if connector_limit is not None and connector_limit <= 0:
+            raise ValueError("connector_limit must be greater than 0.")
+        self.connector_limit: Optional[int] = connector_limit
+        self.loop_monitor: Optional[LoopMonitor] = (
+            LoopMonitor() if loop_monitor is MISSING else loop_monitor
+        )
+        self.accounts: dict[str, _Account] = {}
+        self._connectors: dict[str, aiohttp.TCPConnector] = {}
+        self._metrics_server: Optional[MetricsServer] = None
+
+    async def __aenter__(self) -> ClientPool:
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    def add(
+        self, name: str, client: Client, url: str, token: str, **options: Any
+    ) -> None:
+        """
+        アカウントを追加します
+
+        プールが既に開始している場合は、 :meth:`start` を呼ぶと接続されます
+
+        Parameters
+        ----------
+        name : str
+            メトリクスやログで使うアカウントの名前
+        client : Client
+        url : str
+            インスタンスのURL
+        token : str
+        **options : Any
+            :meth:`Client.start` に渡す引数
+        """
+
+        if name in self.accounts:
+            raise ValueError(f"Account {name} already exists.")
+        # プールの監視と重複するため、Clientごとの監視は行わない
+        client.loop_monitor = None
+        options.setdefault("log_level", None)
+        self.accounts[name] = _Account(name, client, url, token, options)
+
+    async def remove(self, name: str, *, timeout: float = 10.0) -> None:
+        """
+        アカウントを切断し、プールから取り除きます
+        """
+
+        account = self.accounts.pop(name)
+        await self._stop([account], timeout)
+
+    def connector_for(self, url: str) -> aiohttp.TCPConnector:
+        """
+        インスタンスのホストごとに共有されるコネクターを返します
+        """
+
+        host = _host(url)
+        connector = self._connectors.get(host)
+        if connector is None or connector.closed:
+            connector = self._connectors[host] = aiohttp.TCPConnector(
+                limit=self.connector_limit or 0
+            )
+        return connector
+
+    async def start(self) -> None:
+        """
+        まだ開始していないアカウントのログインを ``login_interval`` 秒ずつずらして
+        開始します。全てのログインが開始されるまで待ちます
+        """
+
+        loop = asyncio.get_running_loop()
+        if self.loop_monitor is not None:
+            self.loop_monitor.start(loop)
+        pending = [a for a in self.accounts.values() if a.task is None]
+        for index, account in enumerate(pending):
+            if index and self.login_interval:
+                await asyncio.sleep(self.login_interval)
+            if account.name not in self.accounts:
+                continue
+            client = account.client
+            client.loop = loop
+            client.connector = self.connector_for(account.url)
+            if self.loop_monitor is not None:
+                self.loop_monitor.attach(client._handler_load)
+            account.task = loop.create_task(
+                self._run_account(account), name=f"MiPA-pool-{account.name}"
+            )
+        _log.info(f"Started {len(pending)} accounts")
+
+    async def _run_account(self, account: _Account) -> None:
+        try:
+            await account.client.start(
+                account.url, account.token, **account.options
+            )
+        except Exception as e:
+            account.error = e
+            _log.exception(f"Account {account.name} stopped with an error")
+
+    async def run(self) -> None:
+        """
+        全てのアカウントを開始し、全てのアカウントが停止するまで待ちます
+        """
+
+        await self.start()
+        tasks = [a.task for a in self.accounts.values() if a.task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _stop(self, accounts: list[_Account], timeout: float) -> None:
+        for account in accounts:
+            client = account.client
+            client.should_reconnect = False
+            if client.ws is not None:
+                await client.ws.socket.close()
+        tasks = [a.task for a in accounts if a.task is not None]
+        if tasks:
+            _, running = await asyncio.wait(tasks, timeout=timeout)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        for account in accounts:
+            if self.loop_monitor is not None:
+                self.loop_monitor.detach(account.client._handler_load)
+            core = getattr(account.client, "core", None)
+            session = None if core is None else core.http.session
+            if isinstance(session, aiohttp.ClientSession):
+                await session.close()
+
+    async def close(self, *, timeout: float = 10.0) -> None:
+        """
+        全てのアカウントを切断し、共有しているコネクターを閉じます
+
+        ``timeout`` 秒以内に停止しないアカウントは強制的に停止されます
+        """
+
+        await self._stop(list(self.accounts.values()), timeout)
+        for connector in self._connectors.values():
+            await connector.close()
+        self._connectors.clear()
+        if self.loop_monitor is not None:
+            await self.loop_monitor.stop()
+        await self.stop_metrics_server()
+
+    @property
+    def metrics(self) -> dict[str, dict[str, Any]]:
+        """
+        アカウントの名前ごとの :attr:`Client.metrics`
+        """
+        return {
+            name: account.client.metrics
+            for name, account in self.accounts.items()
+        }
+
+    def to_dict(self) -> dict[str, Any]:
+        states = [account.state for account in self.accounts.values()]
+        return {
+            "accounts": len(states),
+            "connected": states.count("connected"),
+            "starting": states.count("starting"),
+            "failed": states.count("failed"),
+            "connectors": len(self._connectors),
+            "monitor": (
+                None
+                if self.loop_monitor is None
+                else self.loop_monitor.to_dict()
+            ),
+        }
+
+    def render_prometheus(self) -> str:
+        """
+        全てのアカウントの統計情報を ``account`` ラベル付きで返します
+        """
+
+        empty = MetricsRegistry()
+        sources = [
+            (
+                {"account": name},
+                account.client._metrics or empty,
+                account.client._gauges(),
+            )
+            for name, account in self.accounts.items()
+        ]
+        sources.append(({}, empty, {"pool": self.to_dict()}))
+        return render_prometheus(sources)
+
+    async def start_metrics_server(
+        self, host: str = "127.0.0.1", port: int = 9100
+    ) -> MetricsServer:
+        """
+        全てのアカウントの統計情報を返すサーバーを起動します
+
+        Returns
+        -------
+        MetricsServer
+        """
+
+        if self._metrics_server is None:
+            server = MetricsServer(
+                self.render_prometheus, host=host, port=port
+            )
+            await server.start()
+            self._metrics_server = server
+        return self._metrics_server
+
+    async def stop_metrics_server(self) -> None:
+        if self._metrics_server is not None:
+            await self._metrics_server.close()
+            self._metrics_server = None
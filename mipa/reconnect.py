@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import random
+import time
+from typing import Optional
+
+__all__ = ("ReconnectPolicy", "ConnectionHealth")
+
+
+class ReconnectPolicy:
+    """
+    再接続までの待機時間を決めるポリシー
+
+    失敗が続くごとに待機時間を指数的に伸ばし (exponential backoff)、
+    0 から上限までの間でランダムに選びます (full jitter)。
+    連続した失敗が ``failure_threshold`` に達した場合はサーキットブレーカーが開き、
+    ``cooldown`` 秒待ってから 1 度だけ接続を試みます
+
+    Parameters
+    ----------
+    base_delay : float, default 1.0
+        1 回目の失敗後の待機時間の上限 (秒)
+    max_delay : float, default 60.0
+        待機時間の上限 (秒)
+    factor : float, default 2.0
+        失敗するたびに上限に掛ける倍率
+    jitter : bool, default True
+        ``False`` の場合は上限の値をそのまま待機時間にします
+    failure_threshold : Optional[int], default 10
+        サーキットブレーカーが開く連続した失敗の回数。 ``None`` で無効
+    cooldown : float, default 300.0
+        サーキットブレーカーが開いている間の待機時間 (秒)
+    stable_after : float, default 60.0
+        この秒数以上接続が続いた場合、連続した失敗の回数をリセットします
+    rng : Optional[random.Random], default None
+        ジッターに使う乱数生成器。シードを固定すると待機時間を再現できます。
+        ``None`` の場合は ``random`` モジュールの既定の生成器を使います
+    """
+
+    def __init__(
+        self,
+        *,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        factor: float = 2.0,
+        jitter: bool = True,
+        failure_threshold: Optional[int] = 10,
+        cooldown: float = 300.0,
+        stable_after: float = 60.0,
+        rng: Optional[random.Random] = None,
+    ):
+        if base_delay < 0 or max_delay < 0 or cooldown < 0:
+            raise ValueError("delays must be greater than or equal to 0.")
+        if factor < 1:
+            raise ValueError("factor must be greater than or equal to 1.")
+        if failure_threshold is not None and failure_threshold <= 0:
+            raise ValueError("failure_threshold must be greater than 0.")
+        self.base_delay: float = base_delay
+        self.max_delay: float = max_delay
+        self.factor: float = factor
+        self.jitter: bool = jitter
+        self.failure_threshold: Optional[int] = failure_threshold
+        self.cooldown: float = cooldown
+        self.stable_after: float = stable_after
+        self.rng: Optional[random.Random] = rng
+
+    def is_open(self, failures: int) -> bool:
+        """
+        サーキットブレーカーが開いているかを返します
+
+        Parameters
+        ----------
+        failures : int
+            連続した失敗の回数
+        """
+
+        return (
+            self.failure_threshold is not None
+            and failures >= self.failure_threshold
+        )
+
+    def delay(self, failures: int) -> float:
+        """
+        次に接続を試みるまでの待機時間を返します
+
+        Parameters
+        ----------
+        failures : int
+            連続した失敗の回数 (1 以上)
+
+        Returns
+        -------
+        float
+            待機時間 (秒)
+        """
+
+        if self.is_open(failures):
+            return self.cooldown
+        exponent = max(failures - 1, 0)
+        try:
+            ceiling = self.base_delay * self.factor**exponent
+        except OverflowError:
+            ceiling = self.max_delay
+        ceiling = min(ceiling, self.max_delay)
+        if not self.jitter:
+            return ceiling
+        return (random if self.rng is None else self.rng).uniform(0, ceiling)
+
+
+class ConnectionHealth:
+    """
+    WebSocketの接続状況
+
+    Attributes
+    ----------
+    attempts : int
+        接続を試みた回数
+    connects : int
+        接続に成功した回数
+    failures : int
+        接続の失敗、もしくは切断された回数の合計
+    consecutive_failures : int
+        連続した失敗の回数
+    last_failure : Optional[float]
+        最後に失敗した時刻 (UNIX時間)
+    last_error : Optional[str]
+        最後に失敗した原因
+    connected_at : Optional[float]
+        現在の接続が確立した時刻 (UNIX時間)。切断中は ``None``
+    """
+
+    __slots__ = (
+        "attempts",
+        "connects",
+        "failures",
+        "consecutive_failures",
+        "last_failure",
+        "last_error",
+        "connected_at",
+        "_connected_monotonic",
+    )
+
+    def __init__(self) -> None:
+        self.attempts: int = 0
+        self.connects: int = 0
+        self.failures: int = 0
+        self.consecutive_failures: int = 0
+        self.last_failure: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.connected_at: Optional[float] = None
+        self._connected_monotonic: Optional[float] = None
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connected_monotonic is not None
+
+    @property
+    def uptime(self) -> float:
+        """現在の接続が続いている時間 (秒)。切断中は 0"""
+        if self._connected_monotonic is None:
+            return 0.0
+        return time.monotonic() - self._connected_monotonic
+
+    def record_attempt(self) -> None:
+        self.attempts += 1
+
+    def record_connected(self) -> None:
+        self.connects += 1
+        self.connected_at = time.time()
+        self._connected_monotonic = time.monotonic()
+
+    def record_failure(
+        self, error: Optional[BaseException] = None, *, stable: bool = False
+    ) -> None:
+        """
+        接続の失敗もしくは切断を記録します
+
+        Parameters
+        ----------
+        error : Optional[BaseException]
+            原因となった例外
+        stable : bool, default False
+            直前の接続が十分に長く続いていた場合は ``True`` を渡し、
+            連続した失敗の回数を 1 からやり直します
+        """
+
+        if stable:
+            self.consecutive_failures = 0
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.last_failure = time.time()
+        self.last_error = None if error is None else repr(error)
+        self.connected_at = None
+        self._connected_monotonic = None
+
+    def to_dict(self) -> dict[str, int | float | str | None]:
+        return {
+            "attempts": self.attempts,
+            "connects": self.connects,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_failure": self.last_failure,
+            "last_error": self.last_error,
+            "connected_at": self.connected_at,
+            "uptime": self.uptime,
+        }
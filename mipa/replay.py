@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import asyncio
+import gzip
+import logging
+import time
+from typing import TYPE_CHECKING, Any, IO, Iterable, Iterator, Optional
+
+import aiohttp
+
+from mipa.exception import WebSocketReconnect
+from mipa.gateway import MisskeyWebSocket
+
+if TYPE_CHECKING:
+    from mipa.client import Client
+
+__all__ = ("FrameRecorder", "ReplaySocket", "read_frames", "replay")
+
+_log = logging.getLogger(__name__)
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+class FrameRecorder:
+    """
+    受信したフレームをそのままファイルに追記する
+
+    1 行に ``<受信時刻 (UNIX時間)>\\t<フレーム>`` の形で書き込みます。
+    パスが ``.gz`` で終わる場合は gzip で圧縮します。
+    ``Client(recorder=FrameRecorder("session.log"))`` のように渡すと、
+    そのクライアントが受信した全てのテキストフレームが記録されます
+
+    受信ループを止めないよう、フレームはメモリに溜めておき、
+    ``flush_interval`` 秒ごともしくは ``batch_size`` 行溜まるごとに
+    別のスレッドでまとめて書き込み、フラッシュします。
+    プロセスが強制終了した場合に失われるのは、まだ書き込まれていない分だけです
+
+    Parameters
+    ----------
+    path : str
+        書き込むファイルのパス。既に存在する場合は末尾に追記します
+    flush_interval : float, default 1.0
+        溜めたフレームを書き込む間隔 (秒)
+    batch_size : int, default 1000
+        この行数が溜まった場合は ``flush_interval`` を待たずに書き込みます
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        flush_interval: float = 1.0,
+        batch_size: int = 1000,
+    ):
+        if flush_interval <= 0:
+            raise ValueError("flush_interval must be greater than 0.")
+        if batch_size <= 0:
+            raise ValueError("batch_size must be greater than 0.")
+        self.path: str = path
+        self.flush_interval: float = flush_interval
+        self.batch_size: int = batch_size
+        self.frames: int = 0
+        self._file: Optional[IO[str]] = None
+        self._buffer: list[str] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task[None]] = None
+        self._closing: bool = False
+
+    def record(self, data: str, received_at: Optional[float] = None) -> None:
+        """
+        フレームを 1 つ書き込みます
+
+        Parameters
+        ----------
+        data : str
+            受信したフレーム
+        received_at : Optional[float], default None
+            受信した時刻。指定しない場合は現在時刻を使います
+        """
+
+        if received_at is None:
+            received_at = time.time()
+        # JSONの文字列は生の改行を含まないため、空白に置き換えても意味は変わらない
+        if "\n" in data:
+            data = data.replace("\n", " ")
+        self._buffer.append(f"{received_at:.6f}\t{data}\n")
+        self.frames += 1
+        if self._task is None:
+            self._start()
+        elif len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+
+    def _start(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # イベントループの外では直接書き込む
+            self._write(self._take())
+            return
+        self._closing = False
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._writer(), name="MiPA-recorder")
+
+    async def _writer(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(
+                    self._wakeup.wait(), self.flush_interval
+                )
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                _log.exception(f"Failed to write frames to {self.path}")
+
+    def _take(self) -> str:
+        lines, self._buffer = self._buffer, []
+        return "".join(lines)
+
+    def _write(self, text: str) -> None:
+        if self._file is None:
+            self._file = _open(self.path, "a")
+        self._file.write(text)
+        self._file.flush()
+
+    async def flush(self) -> None:
+        """
+        溜めているフレームを別のスレッドで書き込み、フラッシュします
+        """
+
+        if self._lock is None:
+            if self._buffer:
+                self._write(self._take())
+            return
+        # 書き込みの順序を保つため、同時に書き込むスレッドは 1 つだけにする
+        async with self._lock:
+            text = self._take()
+            if text:
+                await asyncio.to_thread(self._write, text)
+
+    async def close(self) -> None:
+        """
+        溜めているフレームを書き込み、ファイルを閉じます
+
+        閉じた後に :meth:`record` を呼ぶと、再びファイルを開いて追記します
+        """
+
+        task, self._task = self._task, None
+        if task is not None:
+            # 書き込み中のスレッドと競合しないよう、キャンセルせずに終了を待つ
+            self._closing = True
+            self._wakeup.set()
+            await asyncio.gather(task, return_exceptions=True)
+        await self.flush()
+        file, self._file = self._file, None
+        if file is not None:
+            await asyncio.to_thread(file.close)
+        self._lock = None
+        self._wakeup = None
+
+
+def read_frames(path: str) -> Iterator[tuple[float, str]]:
+    """
+    :class:`FrameRecorder` で記録したファイルを読み込みます
+
+    プロセスが強制終了した場合など、閉じられずに途中で終わったファイルは
+    最後まで書き込まれた行までを返します
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    Iterator[tuple[float, str]]
+        受信時刻とフレームの組
+    """
+
+    with _open(path, "r") as file:
+        try:
+            for line in file:
+                if not line.endswith("\n"):
+                    # 書き込みの途中で終わった行
+                    break
+                received_at, _, data = line[:-1].partition("\t")
+                if data:
+                    yield float(received_at), data
+        except EOFError:
+            # gzip の終端が書き込まれていない
+            _log.warning(f"{path} ended unexpectedly, stopped reading")
+
+
+class ReplaySocket:
+    """
+    記録したフレームを返す ``ClientWebSocketResponse`` の代わり
+
+    :meth:`MisskeyWebSocket.poll_event` が使うメソッドのみを持ち、
+    全てのフレームを返し終わると閉じられたことを通知します。
+    送信されたフレームは ``sent`` に保存されます
+
+    Parameters
+    ----------
+    frames : Iterable[tuple[float, str]]
+        受信時刻とフレームの組
+    speed : Optional[float], default None
+        再生速度。 ``1.0`` で記録した時と同じ間隔、 ``2.0`` で 2 倍速になります。
+        ``None`` の場合は待たずに最大の速度で再生します
+    """
+
+    compress: int = 0
+
+    def __init__(
+        self,
+        frames: Iterable[tuple[float, str]],
+        *,
+        speed: Optional[float] = None,
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be greater than 0.")
+        self.speed: Optional[float] = speed
+        self.frames: int = 0
+        self.sent: list[str] = []
+        self.closed: bool = False
+        self._frames: Iterator[tuple[float, str]] = iter(frames)
+        self._origin: Optional[tuple[float, float]] = None
+
+    async def receive(self, timeout: Optional[float] = None) -> Any:
+        if self.closed:
+            return aiohttp.http.WS_CLOSED_MESSAGE
+        try:
+            received_at, data = next(self._frames)
+        except StopIteration:
+            self.closed = True
+            return aiohttp.http.WS_CLOSED_MESSAGE
+        if self.speed is not None:
+            now = time.monotonic()
+            if self._origin is None:
+                self._origin = (received_at, now)
+            first_received_at, started_at = self._origin
+            wait = (
+                started_at
+                + (received_at - first_received_at) / self.speed
+                - now
+            )
+            if wait > 0:
+                await asyncio.sleep(wait)
+        self.frames += 1
+        return aiohttp.WSMessage(aiohttp.WSMsgType.TEXT, data, None)
+
+    async def send_str(self, data: str, compress: Any = None) -> None:
+        self.sent.append(data)
+
+    async def ping(self, message: bytes = b"") -> None:
+        pass
+
+    async def pong(self, message: bytes = b"") -> None:
+        pass
+
+    async def close(self, *, code: int = 1000, message: bytes = b"") -> bool:
+        self.closed = True
+        return True
+
+
+async def replay(
+    client: Client, path: str, *, speed: Optional[float] = None
+) -> int:
+    """
+    記録したフレームを ``MisskeyWebSocket`` と ``ConnectionState`` に流します
+
+    Misskeyのインスタンスに接続せずにイベントを発火させるため、
+    解析や発火の速度の計測や、本番で起きた問題の再現に使えます。
+    ``ConnectionState`` がAPIのクライアントを必要とするため、先に
+    :meth:`Client.create_api_session` を呼び出してください (通信は行いません)。
+    ハンドラーの完了は待ちません
+
+    Parameters
+    ----------
+    client : Client
+    path : str
+        :class:`FrameRecorder` で記録したファイルのパス
+    speed : Optional[float], default None
+        再生速度。 ``None`` の場合は最大の速度で再生します
+
+    Returns
+    -------
+    int
+        再生したフレームの数
+    """
+
+    socket = ReplaySocket(read_frames(path), speed=speed)
+    client._connection = client._get_state()
+    ws = MisskeyWebSocket.from_socket(socket, client)
+    client.ws = ws
+    try:
+        while True:
+            await ws.poll_event()
+    except WebSocketReconnect:
+        if ws._receive_queue is not None:
+            await ws._receive_queue.join()
+    finally:
+        await ws.stop_parsers()
+        client._router.close()
+    _log.debug(f"Replayed {socket.frames} frames from {path}")
+    return socket.frames
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import asyncio
+import logging
 import uuid
-from typing import TYPE_CHECKING, Iterable, Literal, overload
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Iterable, Literal, overload
 
+from mipa.codec import JSONCodec, get_codec
 
 if TYPE_CHECKING:
     from mipa.ext.timelines.core import AbstractTimeline
@@ -10,6 +14,8 @@ if TYPE_CHECKING:
 
 __all__ = ["Router"]
 
+_log = logging.getLogger(__name__)
+
 IChannel = Literal["global", "main", "home", "local", "hybrid"]
 
 
@@ -21,16 +27,34 @@ CHANNELS = {
     "hybrid": "hybridTimeline",
 }
 
+# 同じIDに対して打ち消し合うフレームの組
+CANCELLING_FRAMES = {
+    "subNote": "unsubNote",
+    "unsubNote": "subNote",
+    "connect": "disconnect",
+    "disconnect": "connect",
+}
+
 
 class Router:
     def __init__(
-        self, web_socket: ClientWebSocketResponse, max_capure: int = 100
+        self,
+        web_socket: ClientWebSocketResponse,
+        max_capure: int = 100,
+        codec: JSONCodec | None = None,
     ):
         self.web_socket: ClientWebSocketResponse = web_socket
-        self.captured_note: list[str] = []
+        self.codec: JSONCodec = get_codec() if codec is None else codec
+        self.captured_note: OrderedDict[str, None] = OrderedDict()
         self.max_capture: int = max_capure
         self.__channel_ids: dict[str, IChannel] = {}
         self.__channel_handlers: dict[str, AbstractTimeline] = {}
+        self._outbound: list[dict[str, Any] | None] = []
+        self._outbound_index: dict[tuple[str, str], int] = {}
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._writer_task: asyncio.Task[None] | None = None
+        self.sent_frames: int = 0
+        self.cancelled_frames: int = 0
 
     @overload
     async def connect_channel(self, channel_list: Iterable[IChannel]):
@@ -50,6 +74,10 @@ class Router:
         """
         Connects to a channel based on the list passed.
 
+        A channel that is already connected is not connected again; its
+        existing id is returned and its handler is replaced if a new one
+        is passed. Connected channels are kept across reconnects.
+
         Parameters
         ----------
         channel_list : IChannel
@@ -61,27 +89,26 @@ class Router:
         """
 
         _channel_ids: dict[IChannel, str] = {}
-        try:
-            for channel in channel_list:
+        connected = {
+            channel: channel_id
+            for channel_id, channel in self.__channel_ids.items()
+        }
+        for channel in channel_list:
+            if channel not in CHANNELS:
+                break
+            channel_id = connected.get(channel)
+            is_connected = channel_id is not None
+            if channel_id is None:
                 channel_id = f"{uuid.uuid4()}"
-                _channel_ids[channel] = channel_id
                 self.__channel_ids[channel_id] = channel
-                if isinstance(channel_list, dict):
-                    channel_handler = channel_list[channel]
-                    if channel_handler:
-                        self.__channel_handlers[channel_id] = channel_handler
-
-                await self.web_socket.send_json(
-                    {
-                        "type": "connect",
-                        "body": {
-                            "channel": f"{CHANNELS[channel]}",
-                            "id": f"{_channel_ids[channel]}",
-                        },
-                    }
-                )
-        except KeyError:
-            pass
+            _channel_ids[channel] = channel_id
+            if isinstance(channel_list, dict):
+                channel_handler = channel_list[channel]
+                if channel_handler:
+                    self.__channel_handlers[channel_id] = channel_handler
+
+            if not is_connected:
+                self._send(self._connect_frame(channel, channel_id))
         return _channel_ids
 
     async def disconnect_channel(self, channel_id: str):
@@ -94,26 +121,120 @@ class Router:
         """
 
         self.__channel_ids.pop(channel_id)
-        await self.web_socket.send_json(
+        self.__channel_handlers.pop(channel_id, None)
+        self._send(
             {"type": "disconnect", "body": {"id": f"{channel_id}"}}
         )
 
+    @staticmethod
+    def _connect_frame(channel: IChannel, channel_id: str) -> dict[str, Any]:
+        return {
+            "type": "connect",
+            "body": {
+                "channel": f"{CHANNELS[channel]}",
+                "id": f"{channel_id}",
+            },
+        }
+
+    def attach(self, web_socket: ClientWebSocketResponse) -> None:
+        """
+        Switches to a new web socket after a reconnect and subscribes
+        again to every connected channel and captured note.
+
+        The channel ids and handlers are kept, and all frames are sent
+        together in a single batch.
+
+        Parameters
+        ----------
+        web_socket : ClientWebSocketResponse
+        """
+
+        self.close()
+        self.web_socket = web_socket
+        for channel_id, channel in self.__channel_ids.items():
+            self._send(self._connect_frame(channel, channel_id))
+        for note_id in self.captured_note:
+            self._send({"type": "subNote", "body": {"id": f"{note_id}"}})
+
     async def capture_message(self, note_id: str) -> None:
         """
         Captures a message based on the id passed.
+
+        Already captured notes are not subscribed again. When the number
+        of captured notes reaches ``max_capture``, the least recently
+        captured note is unsubscribed.
+
         Parameters
         ----------
         note_id : str
         """
-        if len(self.captured_note) > self.max_capture:
-            await self.web_socket.send_json(
-                {"type": "unsubNote", "body": {"id": f"{note_id}"}}
+        captured_note = self.captured_note
+        if note_id in captured_note:
+            captured_note.move_to_end(note_id)
+            return
+        while captured_note and len(captured_note) >= self.max_capture:
+            evicted_id, _ = captured_note.popitem(last=False)
+            self._send(
+                {"type": "unsubNote", "body": {"id": f"{evicted_id}"}}
             )
-            del self.captured_note[0]
-        self.captured_note.append(note_id)
-        await self.web_socket.send_json(
-            {"type": "subNote", "body": {"id": f"{note_id}"}}
-        )
+        captured_note[note_id] = None
+        self._send({"type": "subNote", "body": {"id": f"{note_id}"}})
+
+    def _send(self, payload: dict[str, Any]) -> None:
+        """
+        フレームを送信キューに積みます
+
+        同じループの間に積まれたフレームは書き込みタスクでまとめて送信されます。
+        送信前に同じIDの subNote/unsubNote や connect/disconnect が
+        揃った場合は、どちらも送信せずに打ち消します
+        """
+
+        frame_type = payload["type"]
+        key = (frame_type, payload["body"]["id"])
+        index = self._outbound_index
+        if key in index:
+            self.cancelled_frames += 1
+            return
+        if (opposite := CANCELLING_FRAMES.get(frame_type)) is not None:
+            opposite_key = (opposite, key[1])
+            if opposite_key in index:
+                self._outbound[index.pop(opposite_key)] = None
+                self.cancelled_frames += 2
+                return
+        index[key] = len(self._outbound)
+        self._outbound.append(payload)
+        if self._writer_task is None or self._writer_task.done():
+            self._writer_task = asyncio.create_task(
+                self._writer(), name="MiPA-router-writer"
+            )
+        self._wakeup.set()
+
+    async def _writer(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            frames = self._outbound
+            self._outbound = []
+            self._outbound_index = {}
+            try:
+                for frame in frames:
+                    if frame is None:
+                        continue
+                    await self.web_socket.send_str(self.codec.dumps(frame))
+                    self.sent_frames += 1
+            except (ConnectionError, RuntimeError):
+                _log.warning("Failed to send frames, the socket is closed")
+
+    def close(self) -> None:
+        """
+        書き込みタスクを停止します。送信されていないフレームは破棄されます
+        """
+
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            self._writer_task = None
+        self._outbound = []
+        self._outbound_index = {}
 
     @property
     def channel_ids(self) -> dict[str, IChannel]:
@@ -0,0 +1,536 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import pickle
+import re
+import socket
+import struct
+import zlib
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Literal, Optional
+
+from mipac.http import Route
+from mipac.models.user import MeDetailed
+
+from mipa.offload import current_client, raw_data
+from mipa.router import IChannel, Router
+from mipa.state import frame_received_at
+
+if TYPE_CHECKING:
+    from multiprocessing.process import BaseProcess
+
+    from mipa.client import Client
+    from mipa.ext.timelines.core import AbstractTimeline
+
+__all__ = ("ShardKey", "ShardManager", "ShardRouter")
+
+_log = logging.getLogger(__name__)
+
+ShardKey = Literal["user", "note"]
+
+# 受信したままのフレームからキーを取り出す。Misskeyはノートの userId を
+# リプライやリノートより前に書き出すため、最初に一致した物がノートの作者になる
+KEY_PATTERNS: dict[ShardKey, re.Pattern[str]] = {
+    "user": re.compile(r'"userId":"([^"]+)"'),
+    "note": re.compile(r'"type":"note","body":\{"id":"([^"]+)"'),
+}
+# noteUpdated の userId はリアクションしたユーザーのため、常にノートのIDで振り分ける
+NOTE_UPDATED_PATTERN = re.compile(
+    r'\{"type":"noteUpdated","body":\{"id":"([^"]+)"'
+)
+CHANNEL_PATTERN = re.compile(r'\{"type":"channel","body":\{"id":"([^"]+)"')
+
+# メッセージは 4 バイトの長さ、1 バイトの種類、本体の順に並ぶ
+_HEADER = struct.Struct(">Ic")
+_TIMESTAMP = struct.Struct(">d")
+
+# 親からワーカー
+FRAME = b"F"  # 受信したフレーム
+RESPONSE = b"R"  # リクエストへの応答
+EVENT = b"E"  # 親で発火した ready や reconnect
+# ワーカーから親
+CAPTURE = b"C"  # ノートの購読
+SEND = b"S"  # WebSocketへ送るフレーム
+REQUEST = b"A"  # APIの呼び出しやチャンネルへの接続
+
+
+def shard_of(key: str, shards: int) -> int:
+    """プロセスを跨いでも変わらないよう、 crc32 でキーをシャードに割り当てます"""
+    return zlib.crc32(key.encode()) % shards
+
+
+def _write(writer: asyncio.StreamWriter, tag: bytes, payload: bytes) -> None:
+    writer.write(_HEADER.pack(len(payload), tag) + payload)
+
+
+async def _read(reader: asyncio.StreamReader) -> tuple[bytes, bytes]:
+    size, tag = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return tag, await reader.readexactly(size)
+
+
+def _dumps_result(request_id: int, ok: bool, value: Any) -> bytes:
+    try:
+        return pickle.dumps((request_id, ok, value))
+    except Exception:
+        # pickle できない例外はメッセージだけを渡す
+        error = RuntimeError(f"{type(value).__name__}: {value}")
+        return pickle.dumps((request_id, False, error))
+
+
+class _Shard:
+    __slots__ = (
+        "index",
+        "process",
+        "reader",
+        "writer",
+        "frames",
+        "api_requests",
+        "api_errors",
+        "reader_task",
+    )
+
+    def __init__(self, index: int, process: BaseProcess):
+        self.index: int = index
+        self.process: BaseProcess = process
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.frames: int = 0
+        self.api_requests: int = 0
+        self.api_errors: int = 0
+        self.reader_task: Optional[asyncio.Task[None]] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.writer is not None and not self.writer.is_closing()
+
+
+class ShardManager:
+    """
+    受信したフレームを複数のプロセスに振り分ける
+
+    WebSocketは親プロセスが保持し、受信したフレームを解析せずに
+    ``shard_by`` で選んだキーのハッシュで決まるワーカーへ送ります。
+    同じユーザー (もしくはノート) のフレームは常に同じワーカーで順番に処理されます。
+    ``noteUpdated`` は ``shard_by`` に関わらずノートのIDで振り分けます。
+    各ワーカーは ``factory()`` で作成したClientで ``ConnectionState`` と
+    イベントの発火を行い、APIのリクエスト、チャンネルへの接続とノートの購読は
+    親プロセスを通して行います。そのため購読は再接続後も維持されます。
+
+    各フックが実行される場所は次の通りです
+
+    - 親とワーカーの両方: ``setup_hook`` 、 ``on_ready`` 、 ``on_reconnect`` 。
+      ワーカーの ``on_ready`` と ``on_reconnect`` には ``ws`` として ``None`` が渡されます
+    - ワーカーのみ: ``on_shard_ready(shard_id)`` と、フレームから発火する全てのイベント
+    - 親のみ: ``connect_channel`` で親にだけハンドラーが登録されたチャンネルのフレーム。
+      ワーカーでも同じチャンネルにハンドラーが登録されている場合はワーカーで処理されます
+
+    Parameters
+    ----------
+    client : Client
+        WebSocketを保持するClient
+    factory : Callable[[], Client]
+        ワーカーでClientを作成する関数。 ``spawn`` で起動するため pickle できる
+        (モジュールの直下に定義された) 必要があります
+    shards : int
+        ワーカーの数
+    shard_by : ShardKey, default "user"
+        ``user`` はノートの作者、 ``note`` はノートのIDで振り分けます。
+        キーが見つからないフレームは最初のワーカーに送られます
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        factory: Callable[[], Client],
+        shards: int,
+        *,
+        shard_by: ShardKey = "user",
+    ):
+        if shards <= 0:
+            raise ValueError("shards must be greater than 0.")
+        if shard_by not in KEY_PATTERNS:
+            raise ValueError(
+                f"shard_by must be one of {tuple(KEY_PATTERNS)}, "
+                f"not {shard_by!r}."
+            )
+        self.client: Client = client
+        self.factory: Callable[[], Client] = factory
+        self.shards: int = shards
+        self.shard_by: ShardKey = shard_by
+        self.dropped: int = 0
+        self._pattern: re.Pattern[str] = KEY_PATTERNS[shard_by]
+        self._shards: list[_Shard] = []
+        self._tasks: set[asyncio.Task[None]] = set()
+        # ワーカーでハンドラーが登録されたチャンネルのID
+        self._worker_channels: set[str] = set()
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._shards)
+
+    async def start(self) -> None:
+        """
+        ワーカーを起動します。既に起動している場合は何もしません
+        """
+
+        if self._shards:
+            return
+        client = self.client
+        context = multiprocessing.get_context("spawn")
+        options = {
+            "url": client.origin_url,
+            "token": client.token,
+            "user": raw_data(client.user),
+        }
+        for index in range(self.shards):
+            parent_sock, child_sock = socket.socketpair()
+            process = context.Process(
+                target=_worker_main,
+                args=(self.factory, index, child_sock, options),
+                name=f"MiPA-shard-{index}",
+                daemon=True,
+            )
+            process.start()
+            child_sock.close()
+            shard = _Shard(index, process)
+            shard.reader, shard.writer = await asyncio.open_unix_connection(
+                sock=parent_sock
+            )
+            shard.reader_task = asyncio.create_task(
+                self._read_shard(shard), name=f"MiPA-shard-reader-{index}"
+            )
+            self._shards.append(shard)
+        _log.info(f"Started {self.shards} shards")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """
+        ワーカーを停止します
+
+        ワーカーは送信済みのフレームを処理してから終了します。
+        ``timeout`` 秒以内に終了しない場合は強制的に終了させます
+        """
+
+        shards, self._shards = self._shards, []
+        for shard in shards:
+            if shard.writer is not None:
+                shard.writer.close()
+        for shard in shards:
+            await asyncio.to_thread(shard.process.join, timeout)
+            if shard.process.is_alive():
+                _log.warning(f"Shard {shard.index} did not exit, killing it")
+                shard.process.kill()
+            if shard.reader_task is not None:
+                shard.reader_task.cancel()
+        tasks = [shard.reader_task for shard in shards if shard.reader_task]
+        await asyncio.gather(*tasks, *self._tasks, return_exceptions=True)
+
+    def shard_for(self, data: str) -> int:
+        """フレームを処理するワーカーの番号を返します"""
+        if self.shards == 1:
+            return 0
+        match = NOTE_UPDATED_PATTERN.match(data) or self._pattern.search(data)
+        return 0 if match is None else shard_of(match.group(1), self.shards)
+
+    def handles_locally(self, data: str) -> bool:
+        """
+        フレームをワーカーへ送らずに親プロセスで処理するかを返します
+
+        ワーカーが起動していない場合と、親プロセスにだけハンドラーが登録された
+        チャンネルのフレームは親プロセスで処理します
+        """
+
+        if not self._shards:
+            return True
+        match = CHANNEL_PATTERN.match(data)
+        if match is None:
+            return False
+        channel_id = match.group(1)
+        return (
+            channel_id not in self._worker_channels
+            and channel_id in self.client.router.channel_handlers
+        )
+
+    def dispatch(self, event_name: str) -> None:
+        """
+        親プロセスで発火した ``ready`` や ``reconnect`` を全てのワーカーで発火します
+        """
+
+        for shard in self._shards:
+            if shard.alive:
+                _write(shard.writer, EVENT, event_name.encode())
+
+    async def feed(self, data: str, received_at: float) -> None:
+        """
+        フレームをワーカーへ送ります
+
+        ワーカーの処理が追いつかず送信バッファが溜まった場合は、
+        受信を止めて待ちます
+
+        Parameters
+        ----------
+        data : str
+            受信したままのフレーム
+        received_at : float
+            受信した時刻 (``time.monotonic()``)
+        """
+
+        shard = self._shards[self.shard_for(data)]
+        writer = shard.writer
+        if writer is None or writer.is_closing():
+            self.dropped += 1
+            return
+        _write(writer, FRAME, _TIMESTAMP.pack(received_at) + data.encode())
+        shard.frames += 1
+        try:
+            await writer.drain()
+        except ConnectionError:
+            _log.error(f"Shard {shard.index} is gone")
+            writer.close()
+
+    async def _read_shard(self, shard: _Shard) -> None:
+        reader = shard.reader
+        client = self.client
+        try:
+            while True:
+                tag, payload = await _read(reader)
+                if tag == CAPTURE:
+                    await client.router.capture_message(payload.decode())
+                elif tag == SEND:
+                    client.router._send(client.codec.loads(payload))
+                elif tag == REQUEST:
+                    task = asyncio.create_task(
+                        self._request(shard, payload),
+                        name=f"MiPA-shard-request-{shard.index}",
+                    )
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            if shard in self._shards:
+                _log.error(f"Shard {shard.index} exited unexpectedly")
+                shard.writer.close()
+
+    async def _request(self, shard: _Shard, payload: bytes) -> None:
+        request_id, kind, args = pickle.loads(payload)
+        try:
+            if kind == "api":
+                shard.api_requests += 1
+                result = await self._api(shard, *args)
+            elif kind == "connect":
+                result = await self._connect_channel(*args)
+            elif kind == "disconnect":
+                result = await self._disconnect_channel(*args)
+            else:
+                raise ValueError(f"Unknown request: {kind}")
+            response = _dumps_result(request_id, True, result)
+        except Exception as e:
+            response = _dumps_result(request_id, False, e)
+        if shard.alive:
+            _write(shard.writer, RESPONSE, response)
+
+    async def _api(
+        self, shard: _Shard, method: str, path: str, kwargs: dict[str, Any]
+    ) -> Any:
+        try:
+            return await self.client.core.http.request(
+                Route(method, path), **kwargs
+            )
+        except Exception:
+            shard.api_errors += 1
+            raise
+
+    async def _connect_channel(
+        self, channels: list[IChannel], handled: list[IChannel]
+    ) -> dict[IChannel, str]:
+        # 接続済みのチャンネルは親のルーターが同じIDを返すため、
+        # 全てのワーカーが接続しても購読は1つになる
+        channel_ids = await self.client.router.connect_channel(channels)
+        for channel in handled:
+            if channel in channel_ids:
+                self._worker_channels.add(channel_ids[channel])
+        return channel_ids
+
+    async def _disconnect_channel(self, channel_id: str) -> None:
+        self._worker_channels.discard(channel_id)
+        router = self.client.router
+        if channel_id in router.channel_ids:
+            await router.disconnect_channel(channel_id)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "shards": len(self._shards),
+            "alive": sum(shard.alive for shard in self._shards),
+            "frames": sum(shard.frames for shard in self._shards),
+            "api_requests": sum(shard.api_requests for shard in self._shards),
+            "api_errors": sum(shard.api_errors for shard in self._shards),
+            "dropped": self.dropped,
+        }
+
+
+class _ParentChannel:
+    """ワーカーから親プロセスへ送るメッセージを扱う"""
+
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer: asyncio.StreamWriter = writer
+        self._request_ids = itertools.count()
+        self._pending: dict[int, asyncio.Future[Any]] = {}
+
+    def send(self, tag: bytes, payload: bytes) -> None:
+        _write(self.writer, tag, payload)
+
+    async def call(self, kind: str, *args: Any) -> Any:
+        """親プロセスで処理を行い、結果を返します"""
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self.send(REQUEST, pickle.dumps((request_id, kind, args)))
+            await self.writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def request(self, route: Any, **kwargs: Any) -> Any:
+        """mipac の ``HTTPClient.request`` の代わりに親プロセスで実行します"""
+        return await self.call("api", route.method, route.path, kwargs)
+
+    def resolve(self, payload: bytes) -> None:
+        request_id, ok, value = pickle.loads(payload)
+        future = self._pending.get(request_id)
+        if future is None or future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def close(self) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Shard was stopped"))
+
+
+class ShardRouter(Router):
+    """
+    ワーカーで使われるルーター
+
+    チャンネルへの接続とノートの購読は親プロセスのルーターで行われるため、
+    購読の上限や再接続時の再購読は全てのワーカーで共有されます。
+    チャンネルのハンドラーはワーカーに保持され、そのワーカーに届いたフレームに使われます
+    """
+
+    def __init__(self, channel: _ParentChannel, **kwargs: Any):
+        super().__init__(None, **kwargs)  # type: ignore[arg-type]
+        self._channel: _ParentChannel = channel
+
+    async def connect_channel(
+        self,
+        channel_list: Iterable[IChannel]
+        | dict[IChannel, AbstractTimeline | None],
+    ) -> dict[IChannel, str]:
+        handlers = channel_list if isinstance(channel_list, dict) else {}
+        handled = [channel for channel, handler in handlers.items() if handler]
+        channel_ids: dict[IChannel, str] = await self._channel.call(
+            "connect", list(channel_list), handled
+        )
+        for channel, channel_id in channel_ids.items():
+            self.channel_ids[channel_id] = channel
+            if handler := handlers.get(channel):
+                self.channel_handlers[channel_id] = handler
+        return channel_ids
+
+    async def disconnect_channel(self, channel_id: str) -> None:
+        self.channel_ids.pop(channel_id, None)
+        self.channel_handlers.pop(channel_id, None)
+        await self._channel.call("disconnect", channel_id)
+
+    async def capture_message(self, note_id: str) -> None:
+        self._channel.send(CAPTURE, note_id.encode())
+
+    def _send(self, payload: dict[str, Any]) -> None:
+        self._channel.send(SEND, self.codec.dumps(payload).encode())
+
+
+def _worker_main(
+    factory: Callable[[], Client],
+    index: int,
+    sock: socket.socket,
+    options: dict[str, Any],
+) -> None:
+    try:
+        asyncio.run(_run_worker(factory, index, sock, options))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _run_worker(
+    factory: Callable[[], Client],
+    index: int,
+    sock: socket.socket,
+    options: dict[str, Any],
+) -> None:
+    reader, writer = await asyncio.open_unix_connection(sock=sock)
+    channel = _ParentChannel(writer)
+    client = factory()
+    client.loop = asyncio.get_running_loop()
+    client.token = options["token"]
+    client.origin_url = options["url"]
+    core = await client.create_api_session(
+        options["token"], options["url"], None
+    )
+    core.http.request = channel.request  # type: ignore[method-assign]
+    client.user = MeDetailed(options["user"], client=core.api)
+    host = re.sub(r"^https?://", "", options["url"]).split("/")[0]
+    core.config.from_dict(
+        host=host,
+        is_ssl=options["url"].startswith("https"),
+        account_id=client.user.id,
+    )
+    client._connection = connection = client._get_state()
+    client._router = ShardRouter(
+        channel, max_capure=client.max_capture, codec=client.codec
+    )
+    if client._executor is not None:
+        client._executor.start(client.loop)
+    if client.loop_monitor is not None:
+        client.loop_monitor.attach(client._handler_load)
+        client.loop_monitor.start(client.loop)
+    codec = client.codec
+    get_parser = connection.get_parser
+    offset = _TIMESTAMP.size
+    current_client.set(client)
+    try:
+        await client.setup_hook()
+        client.dispatch("shard_ready", index)
+        while True:
+            try:
+                tag, payload = await _read(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            if tag == RESPONSE:
+                channel.resolve(payload)
+                continue
+            if tag == EVENT:
+                client.dispatch(payload.decode(), None)
+                continue
+            (received_at,) = _TIMESTAMP.unpack_from(payload)
+            token = frame_received_at.set(received_at)
+            try:
+                msg = codec.loads(payload[offset:])
+                if parser := get_parser(msg["type"]):
+                    await parser(msg)
+            except Exception:
+                _log.exception("Failed to parse the received message")
+            finally:
+                frame_received_at.reset(token)
+    finally:
+        channel.close()
+        if client.loop_monitor is not None:
+            await client.loop_monitor.stop()
+        if client._executor is not None:
+            await client._executor.stop()
+        for pool in client.pools.values():
+            await pool.shutdown()
+        writer.close()
+        _log.debug(f"Shard {index} stopped")
@@ -29,14 +29,15 @@ DEALINGS IN THE SOFTWARE.
 from __future__ import annotations
 
 import asyncio
-import inspect
 import logging
+from contextvars import ContextVar
 from typing import (
     TYPE_CHECKING,
     Any,
     Callable,
     Dict,
     Generic,
+    Optional,
     TypedDict,
     TypeVar,
 )
@@ -62,9 +63,11 @@ from mipac.types.note import (
     INoteUpdatedDelete,
     INoteUpdatedReaction,
 )
-from mipac.utils.format import str_lower, upper_to_lower
+from mipac.utils.format import str_lower
 from mipac.types.notification import INotification
 
+from mipa.utils import LazySnakeCaseDict
+
 
 if TYPE_CHECKING:
     from mipa.client import Client
@@ -73,12 +76,36 @@ _log = logging.getLogger(__name__)
 
 T = TypeVar("T")
 
+# 解析しているフレームを受信した時刻 (time.monotonic())。フレームを解析する間だけ
+# 設定され、フレームから発火したイベントの遅延の計測にのみ使われる
+frame_received_at: ContextVar[Optional[float]] = ContextVar(
+    "mipa_frame_received_at", default=None
+)
+
 
 class IMessage(TypedDict, Generic[T]):
     type: str
     body: dict[str, T]
 
 
+NotificationModel = Callable[..., Any]
+
+# Misskeyから届く通知の型名と、発火するイベント名・モデルの対応表
+NOTIFICATION_TYPES: dict[str, tuple[str, NotificationModel]] = {
+    "follow": ("user_followed", NotificationFollow),
+    "mention": ("mention", NotificationNote),
+    "reply": ("reply", NotificationNote),
+    "renote": ("renote", NotificationNote),
+    "quote": ("quote", NotificationNote),
+    "reaction": ("reaction", NotificationReaction),
+    "pollVote": ("poll_vote", NotificationNote),
+    "pollEnded": ("poll_end", NotificationPollEnd),
+    "receiveFollowRequest": ("follow_request", NotificationFollowRequest),
+    "followRequestAccepted": ("follow_request_accept", NotificationFollow),
+    "achievementEarned": ("achievement_earned", NotificationAchievement),
+}
+
+
 class ConnectionState:
     def __init__(
         self,
@@ -87,15 +114,103 @@ class ConnectionState:
         client: Client,
     ):
         self.__client: Client = client
-        self.__dispatch = dispatch
+        self.__dispatch_event = dispatch
         self.api = client.core.api
         self.loop: asyncio.AbstractEventLoop = loop
-        self.parsers = parsers = {}
-        for attr, func in inspect.getmembers(self):
-            if attr.startswith("parse"):
-                parsers[attr[6:].upper()] = func
+        self.skipped_events: int = 0
+        self.notification_types: dict[
+            str, tuple[str, NotificationModel]
+        ] = client.notification_types
+        # 受信した型名のパーサーのみを保持する
+        self._parser_cache: dict[str, Callable[..., Any] | None] = {}
+
+    @classmethod
+    def _parser_names(cls) -> dict[str, str]:
+        # 接続ごとに全てのメソッドを調べないよう、クラスごとに一度だけ作る
+        names = cls.__dict__.get("_PARSER_NAMES")
+        if names is None:
+            names = {}
+            for attr in dir(cls):
+                if attr.startswith("parse_"):
+                    # Misskeyから届く型名 (camelCase) とsnake_caseの両方で引けるように
+                    event_type = attr[6:]
+                    head, *tail = event_type.split("_")
+                    camel_type = head + "".join(word.title() for word in tail)
+                    names[event_type] = attr
+                    names[camel_type] = attr
+            cls._PARSER_NAMES = names
+        return names
+
+    @property
+    def parsers(self) -> dict[str, Callable[..., Any]]:
+        return {
+            attr[6:].upper(): getattr(self, attr)
+            for attr in dir(self)
+            if attr.startswith("parse")
+        }
+
+    def get_parser(self, event_type: str) -> Callable[..., Any] | None:
+        """
+        Misskeyから届いた型名に対応するパーサーを返します
+
+        存在しない型名もキャッシュされるため、同じ型名の変換は一度しか行われません
+
+        Parameters
+        ----------
+        event_type : str
+            ``note`` や ``emojiAdded`` といった受信したままの型名
+
+        Returns
+        -------
+        Callable[..., Any] | None
+            パーサー。存在しない場合は ``None``
+        """
+
+        try:
+            return self._parser_cache[event_type]
+        except KeyError:
+            name = self._parser_names().get(event_type)
+            if name is None:
+                name = f"parse_{str_lower(event_type)}"
+            func = getattr(self, name, None)
+            self._parser_cache[event_type] = func
+            return func
+
+    def __dispatch(self, event_name: str, *args: Any, **kwargs: Any) -> None:
+        self._observe_dispatch(event_name)
+        self.__dispatch_event(event_name, *args, **kwargs)
+
+    def _observe_dispatch(self, event_name: str) -> None:
+        """
+        解析しているフレームを受信してからイベントを発火するまでの時間を記録します
+
+        ``ready`` や ``Client.dispatch`` の直接の呼び出しなど、
+        フレームの解析中でない場合は記録しません
+        """
+
+        monitor = self.__client.loop_monitor
+        if monitor is None:
+            return
+        received_at = frame_received_at.get()
+        if received_at is not None and self.__client.has_listener(event_name):
+            monitor.observe_dispatch(received_at)
+
+    def _is_subscribed(self, event_name: str) -> bool:
+        """
+        イベントを受け取るリスナーが存在するかを返します
+
+        存在しない場合は ``skipped_events`` を増やします。
+        パーサーはモデルを作成する前にこれを確認します
+        """
+
+        if self.__client.has_listener(event_name):
+            return True
+        self.skipped_events += 1
+        return False
 
     async def parse_emoji_added(self, message: Dict[str, Any], **kwargs):
+        if not self._is_subscribed("emoji_add"):
+            return
         self.__dispatch(
             "emoji_add", CustomEmoji(message["body"]["emoji"], client=self.api)
         )
@@ -103,6 +218,8 @@ class ConnectionState:
     async def parse_emoji_deleted(
         self, message: IMessage[list[ICustomEmoji]], **kwargs
     ):
+        if not self._is_subscribed("emoji_deleted"):
+            return
         self.__dispatch(
             "emoji_deleted",
             [
@@ -114,6 +231,8 @@ class ConnectionState:
     async def parse_emoji_updated(
         self, message: IMessage[list[ICustomEmoji]], **kwargs
     ):
+        if not self._is_subscribed("emoji_updated"):
+            return
         self.__dispatch(
             "emoji_updated",
             [
@@ -132,11 +251,10 @@ class ConnectionState:
         message : Dict[str, Any]
             Received message
         """
-        base_msg = upper_to_lower(message["body"])
-        channel_type = str_lower(base_msg.get("type"))
-        _log.debug(f"ChannelType: {channel_type}")
+        base_msg = LazySnakeCaseDict.wrap(message["body"])
+        channel_type = base_msg.get("type")
         _log.debug(f"recv event type: {channel_type}")
-        if func := getattr(self, f"parse_{channel_type}", None):
+        if func := self.get_parser(channel_type):
             await func(
                 base_msg["body"], channel_id=base_msg["id"]
             )  # parse_note意外が呼ばれたらエラー出るかも
@@ -149,6 +267,8 @@ class ConnectionState:
         """
         When you follow someone, this event will be called
         """
+        if not self._is_subscribed("user_follow"):
+            return
         user = UserDetailedNotMe(
             message,
             client=self.api,
@@ -161,6 +281,8 @@ class ConnectionState:
         """
         When you unfollow someone, this event will be called
         """
+        if not self._is_subscribed("user_unfollow"):
+            return
         user = UserDetailedNotMe(
             message,
             client=self.api,
@@ -173,8 +295,8 @@ class ConnectionState:
         """
 
     async def parse_note_updated(self, note_data: INoteUpdated[Any], **kwargs):
-        message: Dict[str, Any] = upper_to_lower(note_data)
-        if func := getattr(self, f'parse_{message["body"]["type"]}', None):
+        message = LazySnakeCaseDict.wrap(note_data)
+        if func := self.get_parser(message["body"]["type"]):
             await func(message)
         else:
             _log.debug(
@@ -184,11 +306,15 @@ class ConnectionState:
     async def parse_deleted(
         self, note: INoteUpdated[INoteUpdatedDelete], **kwargs
     ):
+        if not self._is_subscribed("note_deleted"):
+            return
         self.__dispatch("note_deleted", NoteDeleted(note))
 
     async def parse_unreacted(
         self, reaction: INoteUpdated[INoteUpdatedReaction], **kwargs
     ):
+        if not self._is_subscribed("unreacted"):
+            return
         self.__dispatch(
             "unreacted", PartialReaction(reaction, client=self.api)
         )
@@ -196,9 +322,13 @@ class ConnectionState:
     async def parse_reacted(
         self, reaction: INoteUpdated[INoteUpdatedReaction], **kwargs
     ):
+        if not self._is_subscribed("reacted"):
+            return
         self.__dispatch("reacted", PartialReaction(reaction, client=self.api))
 
     async def parse_me_updated(self, user: IMeDetailedSchema, **kwargs):
+        if not self._is_subscribed("me_updated"):
+            return
         self.__dispatch("me_updated", MeDetailed(user, client=self.api))
 
     async def parse_announcement_created(
@@ -214,6 +344,8 @@ class ConnectionState:
     async def parse_drive_file_created(
         self, message: Dict[str, Any], **kwargs
     ) -> None:
+        if not self._is_subscribed("drive_file_created"):
+            return
         self.__dispatch("drive_file_created", message)
 
     async def parse_read_all_unread_mentions(
@@ -267,48 +399,18 @@ class ConnectionState:
         message: Dict[str, Any]
             Received message
         """
-        message: INotification = upper_to_lower(notification_data)
-        notification_map: dict[
-            str,
-            tuple[
-                str,
-                [
-                    NotificationFollow
-                    | NotificationNote
-                    | NotificationReaction
-                    | NotificationPollEnd
-                    | NotificationFollowRequest
-                ],
-            ],
-        ] = {
-            "follow": ("user_followed", NotificationFollow),
-            "mention": ("mention", NotificationNote),
-            "reply": ("reply", NotificationNote),
-            "renote": ("renote", NotificationNote),
-            "quote": ("quote", NotificationNote),
-            "reaction": ("reaction", NotificationReaction),
-            "poll_vote": ("poll_vote", NotificationNote),
-            "poll_ended": ("poll_end", NotificationPollEnd),
-            "receive_follow_request": (
-                "follow_request",
-                NotificationFollowRequest,
-            ),
-            "follow_request_accepted": (
-                "follow_request_accept",
-                NotificationFollow,
-            ),
-            "achievement_earned": (
-                "achievement_earned",
-                NotificationAchievement,
-            ),
-        }
-        dispatch_path, parse_class = notification_map.get(
-            str_lower(message["type"]), (None, None)
-        )
-        if dispatch_path and parse_class:
-            self.__dispatch(
-                dispatch_path, parse_class(message, client=self.api)
-            )
+        message: INotification = LazySnakeCaseDict.wrap(notification_data)
+        notification_type = message["type"]
+        try:
+            dispatch_path, parse_class = self.notification_types[
+                notification_type
+            ]
+        except KeyError:
+            _log.debug(f"Unknown notification type: {notification_type}")
+            return
+        if not self._is_subscribed(dispatch_path):
+            return
+        self.__dispatch(dispatch_path, parse_class(message, client=self.api))
 
     async def parse_unread_notification(
         self, message: Dict[str, Any], **kwargs
@@ -327,10 +429,22 @@ class ConnectionState:
     async def parse_note(self, message: INote, channel_id: str) -> None:
         """
         ノートイベントを解析する関数
+
+        ``on_note`` のリスナーとチャンネルのハンドラーがどちらも存在しない場合、
+        ノートの購読のみを行い Note モデルは作成しません
         """
+        router = self.__client.router
+        await router.capture_message(message["id"])
+        handler = router.channel_handlers.get(channel_id)
+        has_listener = self.__client.has_listener("note")
+        if handler is None and not has_listener:
+            self.skipped_events += 1
+            return
         note = Note(message, self.api)
-        await self.__client.router.capture_message(note.id)
-        handler = self.__client.router.channel_handlers.get(channel_id)
+        if has_listener:
+            # チャンネルのハンドラーの処理時間を遅延に含めないよう、先に記録する
+            self._observe_dispatch("note")
         if handler:
             await handler.on_note(note)
-        self.__dispatch("note", note)
+        if has_listener:
+            self.__dispatch_event("note", note)
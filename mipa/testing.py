@@ -0,0 +1,389 @@
+from __future__ import annotations
+
+import asyncio
+import copy
+import logging
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import aiohttp
+from aiohttp import web
+
+from mipa.codec import JSONCodec, get_codec
+
+__all__ = ("MockMisskeyServer",)
+
+_log = logging.getLogger(__name__)
+
+# 負荷試験で使うノートの雛形。 id, createdAt, text は送信時に置き換えられる
+NOTE_TEMPLATE: dict[str, Any] = {
+    "id": "",
+    "createdAt": "",
+    "userId": "9k000000mock",
+    "user": {
+        "id": "9k000000mock",
+        "name": "Mock",
+        "username": "mock",
+        "host": None,
+        "avatarUrl": None,
+        "avatarBlurhash": None,
+        "avatarDecorations": [],
+        "isBot": True,
+        "isCat": False,
+        "emojis": {},
+        "onlineStatus": "unknown",
+        "badgeRoles": [],
+    },
+    "text": "",
+    "cw": None,
+    "visibility": "public",
+    "localOnly": False,
+    "reactionAcceptance": None,
+    "renoteCount": 0,
+    "repliesCount": 0,
+    "reactions": {},
+    "reactionEmojis": {},
+    "emojis": {},
+    "tags": [],
+    "fileIds": [],
+    "files": [],
+    "replyId": None,
+    "renoteId": None,
+    "uri": None,
+    "url": None,
+}
+
+# ノートが流れるタイムラインのチャンネル
+TIMELINE_CHANNELS = (
+    "globalTimeline",
+    "homeTimeline",
+    "localTimeline",
+    "hybridTimeline",
+)
+
+
+class _Connection:
+    __slots__ = ("socket", "channels", "captured_notes")
+
+    def __init__(self, socket: web.WebSocketResponse):
+        self.socket: web.WebSocketResponse = socket
+        # チャンネル名: そのチャンネルに接続した際のID
+        self.channels: dict[str, str] = {}
+        self.captured_notes: set[str] = set()
+
+
+class MockMisskeyServer:
+    """
+    負荷試験やベンチマークのためのMisskeyの代わりとなるサーバー
+
+    同じプロセスのイベントループで aiohttp のサーバーを起動し、
+    ``Client.start`` のログインと接続に必要な最小限の機能を提供します。
+
+    - ``POST /api/i`` は ``me`` を返します。その他の ``/api/*`` は 204 を返します
+    - ``/streaming`` は ``connect`` / ``disconnect`` / ``subNote`` /
+      ``unsubNote`` を受け付け、接続しているチャンネルにのみノートを送ります
+    - :meth:`start_firehose` で指定した速度の合成ノートを流し続けます
+
+    .. code-block:: python
+
+        async with MockMisskeyServer() as server:
+            server.start_firehose(10_000)
+            await client.start(server.url, server.token)
+
+    Parameters
+    ----------
+    token : str, default "mock-token"
+        ログインに使うトークン
+    me : Optional[dict[str, Any]], default None
+        ``i`` エンドポイントが返すユーザー。指定しない場合は雛形のユーザーを使います
+    host : str, default "127.0.0.1"
+    port : int, default 0
+        0 の場合は空いているポートを使います
+    codec : Optional[JSONCodec], default None
+        フレームのエンコードに使うコーデック
+    """
+
+    def __init__(
+        self,
+        *,
+        token: str = "mock-token",
+        me: Optional[dict[str, Any]] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        codec: Optional[JSONCodec] = None,
+    ):
+        self.token: str = token
+        self.me: dict[str, Any] = (
+            copy.deepcopy(NOTE_TEMPLATE["user"]) if me is None else me
+        )
+        self.host: str = host
+        self.port: int = port
+        self.codec: JSONCodec = get_codec() if codec is None else codec
+        self.connections: list[_Connection] = []
+        self.received_frames: Counter[str] = Counter()
+        self.sent_notes: int = 0
+        self.max_tracked_notes: int = 100_000
+        self._sent_at: OrderedDict[str, float] = OrderedDict()
+        self._note_seq: int = 0
+        self._firehose_task: Optional[asyncio.Task[None]] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._app = web.Application()
+        self._app.router.add_get("/streaming", self._streaming)
+        self._app.router.add_post("/api/i", self._i)
+        self._app.router.add_post("/api/{endpoint:.*}", self._endpoint)
+
+    @property
+    def url(self) -> str:
+        """``Client.start`` に渡すURL"""
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self._app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if self.port == 0:
+            self.port = site._server.sockets[0].getsockname()[1]
+        _log.debug(f"Mock server is listening on {self.url}")
+
+    async def close(self) -> None:
+        self.stop_firehose()
+        for connection in list(self.connections):
+            await connection.socket.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> MockMisskeyServer:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        await self.close()
+
+    def _check_token(self, body: Any) -> bool:
+        return isinstance(body, dict) and body.get("i") == self.token
+
+    async def _i(self, request: web.Request) -> web.Response:
+        if not self._check_token(await request.json()):
+            return web.json_response(
+                {"error": {"code": "CREDENTIAL_REQUIRED"}}, status=401
+            )
+        return web.json_response(self.me, dumps=self.codec.dumps)
+
+    async def _endpoint(self, request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    async def _streaming(
+        self, request: web.Request
+    ) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        if request.query.get("i") != self.token:
+            raise web.HTTPUnauthorized()
+        await socket.prepare(request)
+        connection = _Connection(socket)
+        self.connections.append(connection)
+        try:
+            async for message in socket:
+                if message.type is aiohttp.WSMsgType.TEXT:
+                    frame = self.codec.loads(message.data)
+                    self._handle_frame(connection, frame)
+        finally:
+            self.connections.remove(connection)
+        return socket
+
+    def _handle_frame(
+        self, connection: _Connection, frame: dict[str, Any]
+    ) -> None:
+        frame_type = frame.get("type")
+        body = frame.get("body") or {}
+        self.received_frames[frame_type] += 1
+        if frame_type == "connect":
+            connection.channels[body["channel"]] = body["id"]
+        elif frame_type == "disconnect":
+            for channel, channel_id in list(connection.channels.items()):
+                if channel_id == body["id"]:
+                    del connection.channels[channel]
+        elif frame_type == "subNote":
+            connection.captured_notes.add(body["id"])
+        elif frame_type == "unsubNote":
+            connection.captured_notes.discard(body["id"])
+
+    def make_note(self, **fields: Any) -> dict[str, Any]:
+        """
+        合成したノートを作成します
+
+        Parameters
+        ----------
+        **fields : Any
+            雛形を上書きするフィールド (camelCase)
+
+        Returns
+        -------
+        dict[str, Any]
+        """
+
+        self._note_seq += 1
+        note = dict(NOTE_TEMPLATE)
+        note["id"] = f"mock{self._note_seq:012x}"
+        note["createdAt"] = datetime.now(timezone.utc).isoformat()
+        note["text"] = f"mock note {self._note_seq}"
+        note.update(fields)
+        return note
+
+    async def send_note(
+        self, note: dict[str, Any], channel: str = "globalTimeline"
+    ) -> int:
+        """
+        ``channel`` に接続している全ての接続へノートを送ります
+
+        Returns
+        -------
+        int
+            ノートを送った接続の数
+        """
+
+        sent = 0
+        frames: dict[str, str] = {}
+        for connection in self.connections:
+            channel_id = connection.channels.get(channel)
+            if channel_id is None:
+                continue
+            if channel_id not in frames:
+                frames[channel_id] = self.codec.dumps(
+                    {
+                        "type": "channel",
+                        "body": {
+                            "id": channel_id,
+                            "type": "note",
+                            "body": note,
+                        },
+                    }
+                )
+            await connection.socket.send_str(frames[channel_id])
+            sent += 1
+        if sent:
+            self.sent_notes += 1
+            self._track(note["id"])
+        return sent
+
+    async def send_note_updated(
+        self, note_id: str, event_type: str, body: dict[str, Any]
+    ) -> int:
+        """
+        ``subNote`` でノートを購読している接続にのみ ``noteUpdated`` を送ります
+
+        Parameters
+        ----------
+        note_id : str
+        event_type : str
+            ``reacted`` や ``deleted`` などの種類
+        body : dict[str, Any]
+
+        Returns
+        -------
+        int
+            送った接続の数
+        """
+
+        data = self.codec.dumps(
+            {
+                "type": "noteUpdated",
+                "body": {"id": note_id, "type": event_type, "body": body},
+            }
+        )
+        sent = 0
+        for connection in self.connections:
+            if note_id in connection.captured_notes:
+                await connection.socket.send_str(data)
+                sent += 1
+        return sent
+
+    def _track(self, note_id: str) -> None:
+        sent_at = self._sent_at
+        sent_at[note_id] = time.monotonic()
+        if len(sent_at) > self.max_tracked_notes:
+            sent_at.popitem(last=False)
+
+    def latency_of(self, note_id: str) -> Optional[float]:
+        """
+        ノートを送信してからの経過時間 (秒) を返します
+
+        ``on_note`` の中で呼び出すと、送信から受信までの遅延を計測できます。
+        直近 ``max_tracked_notes`` 件のみ記録されます
+        """
+
+        sent_at = self._sent_at.get(note_id)
+        if sent_at is None:
+            return None
+        return time.monotonic() - sent_at
+
+    def start_firehose(
+        self,
+        rate: float,
+        *,
+        total: Optional[int] = None,
+        channel: str = "globalTimeline",
+        tick: float = 0.01,
+    ) -> asyncio.Task[None]:
+        """
+        合成したノートを流し始めます
+
+        ``tick`` 秒ごとにその間に送るべき数のノートをまとめて送るため、
+        sleep の精度よりも高い速度を指定できます。
+        接続がまだ無い間は送信されません
+
+        Parameters
+        ----------
+        rate : float
+            1 秒あたりのノートの数
+        total : Optional[int], default None
+            送るノートの総数。 ``None`` の場合は停止するまで送り続けます
+        channel : str, default "globalTimeline"
+            ノートを流すチャンネル
+        tick : float, default 0.01
+            送信する間隔 (秒)
+
+        Returns
+        -------
+        asyncio.Task[None]
+            全てのノートを送り終えると完了するタスク
+        """
+
+        if rate <= 0:
+            raise ValueError("rate must be greater than 0.")
+        if channel not in TIMELINE_CHANNELS and channel != "main":
+            raise ValueError(f"{channel!r} is not a streaming channel.")
+        self.stop_firehose()
+        self._firehose_task = asyncio.create_task(
+            self._firehose(rate, total, channel, tick),
+            name="MiPA-mock-firehose",
+        )
+        return self._firehose_task
+
+    def stop_firehose(self) -> None:
+        if self._firehose_task is not None:
+            self._firehose_task.cancel()
+            self._firehose_task = None
+
+    async def _firehose(
+        self, rate: float, total: Optional[int], channel: str, tick: float
+    ) -> None:
+        sent = sent_before = 0
+        started_at: Optional[float] = None
+        while total is None or sent < total:
+            await asyncio.sleep(tick)
+            if not any(channel in c.channels for c in self.connections):
+                started_at = None
+                continue
+            now = time.monotonic()
+            if started_at is None:
+                started_at, sent_before = now, sent
+            due = sent_before + int((now - started_at) * rate) - sent
+            if total is not None:
+                due = min(due, total - sent)
+            for _ in range(due):
+                await self.send_note(self.make_note(), channel)
+                sent += 1
@@ -1,5 +1,9 @@
+from __future__ import annotations
+
+import functools
 import logging
-from typing import Any, Literal
+import re
+from typing import Any, Iterator, Literal, Mapping
 
 LOGING_LEVEL_TYPE = Literal[
     "NOTSET", "DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"
@@ -27,6 +31,92 @@ class _MissingSentinel:
 
 MISSING: Any = _MissingSentinel()
 
+_UPPER_PATTERN = re.compile("[A-Z]")
+_SNAKE_PATTERN = re.compile("_([a-z])")
+
+
+@functools.lru_cache(maxsize=4096)
+def camel_to_snake(key: str) -> str:
+    """
+    mipac の ``upper_to_lower`` と同じ規則でキーを snake_case にします
+    """
+    return _UPPER_PATTERN.sub(lambda m: "_" + m.group().lower(), key)
+
+
+@functools.lru_cache(maxsize=4096)
+def snake_to_camel(key: str) -> str:
+    """
+    :func:`camel_to_snake` の逆変換を行います
+    """
+    return _SNAKE_PATTERN.sub(lambda m: m.group(1).upper(), key)
+
+
+class LazySnakeCaseDict(Mapping[str, Any]):
+    """
+    camelCase のキーを持つ dict を snake_case のキーで参照するためのビュー
+
+    ``upper_to_lower`` のように全体を作り直さず、参照されたキーだけを変換し
+    結果をキーごとにキャッシュします。ネストされた dict も参照された時点で
+    同じビューに包まれます
+
+    Parameters
+    ----------
+    data : dict[str, Any]
+        Misskeyから受信したままの dict
+    """
+
+    __slots__ = ("_data", "_cache")
+
+    def __init__(self, data: Mapping[str, Any]):
+        self._data: Mapping[str, Any] = data
+        self._cache: dict[str, Any] = {}
+
+    @classmethod
+    def wrap(cls, data: Any) -> Any:
+        """
+        dict であればビューに包み、既にビューであればそのまま返します
+        """
+        if isinstance(data, cls) or not isinstance(data, dict):
+            return data
+        return cls(data)
+
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        data = self._data
+        if key in data:
+            value = data[key]
+        else:
+            camel_key = snake_to_camel(key)
+            if camel_key == key or camel_key not in data:
+                raise KeyError(key)
+            value = data[camel_key]
+        if isinstance(value, dict):
+            value = LazySnakeCaseDict(value)
+        elif isinstance(value, list):
+            value = [
+                LazySnakeCaseDict(i) if isinstance(i, dict) else i
+                for i in value
+            ]
+        self._cache[key] = value
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        return (camel_to_snake(key) for key in self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"<LazySnakeCaseDict {self._data!r}>"
+
+    @property
+    def raw(self) -> Mapping[str, Any]:
+        """変換前の dict"""
+        return self._data
+
 
 def parse_logging_level(level: LOGING_LEVEL_TYPE):
     if level in LOGING_LEVELS:
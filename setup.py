@@ -12,8 +12,9 @@ with open('requirements.txt', 'r') as f:
     requirements = f.read().splitlines()
 
 extras_require = {
-    'dev': ['ruff', 'isort', 'mypy', 'flake8'],
-    'ci': ['flake8', 'mypy'],
+    'dev': ['ruff', 'isort', 'mypy', 'flake8', 'pytest', 'pytest-asyncio'],
+    'ci': ['flake8', 'mypy', 'pytest', 'pytest-asyncio'],
+    'speed': ['orjson'],
 }
 
 packages = ['mipa', 'mipa.ext', 'mipa.ext.commands', 'mipa.ext.tasks', 'mipa.ext.timelines']
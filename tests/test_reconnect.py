@@ -0,0 +1,139 @@
+"""
+MockMisskeyServer から接続を切り、再接続の挙動を確認するテスト
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from typing import Callable
+
+import pytest
+
+from mipa import Client
+from mipa.reconnect import ReconnectPolicy
+from mipa.testing import MockMisskeyServer
+
+SEED = 20240101
+BASE_DELAY = 0.05
+MAX_DELAY = 0.2
+FAILURE_THRESHOLD = 3
+COOLDOWN = 0.5
+DROPS = 4
+
+
+class RecordingPolicy(ReconnectPolicy):
+    """返した待機時間を記録するポリシー"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.delays: list[tuple[int, float]] = []
+
+    def delay(self, failures: int) -> float:
+        delay = super().delay(failures)
+        self.delays.append((failures, delay))
+        return delay
+
+
+def make_policy() -> RecordingPolicy:
+    return RecordingPolicy(
+        base_delay=BASE_DELAY,
+        max_delay=MAX_DELAY,
+        failure_threshold=FAILURE_THRESHOLD,
+        cooldown=COOLDOWN,
+        rng=random.Random(SEED),
+    )
+
+
+def expected_delays(drops: int) -> list[float]:
+    rng = random.Random(SEED)
+    delays = []
+    for failures in range(1, drops + 1):
+        if failures >= FAILURE_THRESHOLD:
+            delays.append(COOLDOWN)
+        else:
+            ceiling = min(BASE_DELAY * 2 ** (failures - 1), MAX_DELAY)
+            delays.append(rng.uniform(0, ceiling))
+    return delays
+
+
+async def wait_until(
+    predicate: Callable[[], bool], timeout: float = 5.0
+) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            pytest.fail("timed out waiting for the condition")
+        await asyncio.sleep(0.01)
+
+
+def test_delay_is_reproducible_with_seeded_rng():
+    policy = make_policy()
+    delays = [policy.delay(failures) for failures in range(1, DROPS + 1)]
+    assert delays == pytest.approx(expected_delays(DROPS))
+    assert not policy.is_open(FAILURE_THRESHOLD - 1)
+    assert policy.is_open(FAILURE_THRESHOLD)
+
+
+@pytest.mark.asyncio
+async def test_reconnect_after_server_drops_connection():
+    policy = make_policy()
+    client = Client(reconnect_policy=policy)
+    ready: list[float] = []
+    reconnects: list[float] = []
+
+    async def on_ready(ws):
+        ready.append(time.monotonic())
+        await client.router.connect_channel(["global", "main"])
+
+    async def on_reconnect(ws):
+        reconnects.append(time.monotonic())
+
+    client.add_listener(on_ready)
+    client.add_listener(on_reconnect)
+
+    async with MockMisskeyServer() as server:
+        task = asyncio.create_task(
+            client.start(server.url, server.token, log_level=None)
+        )
+        try:
+            await wait_until(
+                lambda: bool(server.connections)
+                and len(server.connections[-1].channels) == 2
+            )
+            note = server.make_note()
+            await client.router.capture_message(note["id"])
+            await wait_until(
+                lambda: note["id"] in server.connections[-1].captured_notes
+            )
+            channels = dict(server.connections[-1].channels)
+
+            for failures, expected in enumerate(expected_delays(DROPS), 1):
+                dropped_at = time.monotonic()
+                await server.connections[-1].socket.close()
+                await wait_until(
+                    lambda failures=failures: len(reconnects) == failures,
+                    timeout=COOLDOWN + 5.0,
+                )
+                recorded_failures, delay = policy.delays[-1]
+                assert recorded_failures == failures
+                assert delay == pytest.approx(expected)
+                if failures >= FAILURE_THRESHOLD:
+                    # サーキットブレーカーが開き、 cooldown 秒待つ
+                    assert delay == COOLDOWN
+                assert reconnects[-1] - dropped_at >= delay
+                # 同じIDでチャンネルへの接続とノートの購読が送り直される
+                await wait_until(
+                    lambda: server.connections[-1].channels == channels
+                    and note["id"] in server.connections[-1].captured_notes
+                )
+
+            assert len(ready) == 1
+            assert len(reconnects) == DROPS
+            assert client.health.attempts == DROPS + 1
+            assert client.health.consecutive_failures == DROPS
+        finally:
+            await client.disconnect()
+            await asyncio.wait_for(task, 10)
+            await client.core.close_session()